@@ -0,0 +1,241 @@
+"""
+make_seto-map.py（seto_map.py）のビルドを合成データで計測する
+
+  python bench_seto-map.py                          # 1k / 10k / 100k / 1M 行 → bench-report.json
+  python bench_seto-map.py --sizes 1000,10000 --build-args="--cluster --cull"
+  python bench_seto-map.py --compare old.json       # 前回のレポートと比べ、悪化があれば終了コード 1
+
+サイズごとに一時ディレクトリへ合成CSVを作り、別プロセスで build() を1回走らせる
+（キャッシュ無し・ピークRSS をサイズごとに分けるため）。
+"""
+import argparse
+import gzip
+import importlib.util
+import json
+import os
+import re
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(HERE, "seto_map.py")
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+BBOX = (33.7, 132.0, 34.8, 134.6)  # 瀬戸内（s, w, n, e）
+JUNK_RATE = 0.01                   # normalize_latlon が落とすべき行の割合
+ISLAND_MIN_ZOOMS = ["", "", "", "9", "10.5", "11", "12", "14", "x"]  # 空・小数・不正値を混ぜる
+
+# 計測するステージ（seto_map の関数名）。入れ子の呼び出しはそれぞれに計上される
+STAGES = [
+    "load_frames", "normalize_latlon", "find_duplicates", "layer_points", "nearby_refs", "layer_payload",
+    "area_payload", "density_levels", "search_index", "export_tiles", "minify_html", "precompress",
+]
+
+def load_build_module():
+    spec = importlib.util.spec_from_file_location("seto_map_build", SCRIPT)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+# =====================
+# 合成データ
+# - 各CSVは本物と同じヘッダー、点は BBOX 内に一様
+# - JUNK_RATE の行は lat / lon を空・文字列にする
+# - 島は rows/10、地域は rows/100 行（島の min_zoom は ISLAND_MIN_ZOOMS から）
+# =====================
+def header_of(path: str) -> list:
+    return list(pd.read_csv(os.path.join(HERE, path), nrows=0).columns)
+
+def synthetic_frame(columns: list, n: int, rng: np.random.Generator, tag: str) -> pd.DataFrame:
+    s, w, north, e = BBOX
+    lat = rng.uniform(s, north, n).round(6).astype(object)
+    lon = rng.uniform(w, e, n).round(6).astype(object)
+    junk = rng.random(n) < JUNK_RATE
+    lat[junk & (rng.random(n) < 0.5)] = ""
+    lon[junk] = "N/A"
+
+    ids = np.arange(n).astype(str)
+    df = pd.DataFrame({col: "" for col in columns}, index=range(n))
+    df["name"] = np.char.add(f"{tag}-", ids)
+    df["lat"] = lat
+    df["lon"] = lon
+    for col in ("url", "x_url", "instagram_url"):
+        if col in df.columns:
+            df[col] = np.where(rng.random(n) < 0.7, np.char.add(f"https://example.com/{tag}/{col}/", ids), "")
+    if "min_zoom" in df.columns:
+        df["min_zoom"] = rng.choice(ISLAND_MIN_ZOOMS, n)
+    return df
+
+def make_dataset(out_dir: str, mod, rows: int, seed: int = 0) -> dict:
+    """out_dir に全CSVを書き、CSVごとの行数を返す"""
+    rng = np.random.default_rng(seed)
+    counts = {}
+    for path in mod.csv_paths():
+        n = rows
+        if path == mod.ISLANDS_CSV:
+            n = max(rows // 10, 10)
+        elif path == mod.REGIONS_CSV:
+            n = max(rows // 100, 10)
+        df = synthetic_frame(header_of(path), n, rng, os.path.splitext(path)[0])
+        # static レイヤー（match で絞るもの）にも少し当たるようにする
+        for spec in mod.LAYERS:
+            if spec["csv"] == path and spec.get("match"):
+                df.loc[df.index[::50], "name"] = spec["match"] + df["name"][::50]
+        df.to_csv(os.path.join(out_dir, path), index=False)
+        counts[path] = n
+    return counts
+
+# =====================
+# 1サイズ分のビルド（子プロセス）
+# =====================
+def timed(stats: dict, name: str, fn):
+    def wrapper(*a, **kw):
+        t0 = time.perf_counter()
+        try:
+            return fn(*a, **kw)
+        finally:
+            st = stats.setdefault(name, {"seconds": 0.0, "calls": 0})
+            st["seconds"] += time.perf_counter() - t0
+            st["calls"] += 1
+    return wrapper
+
+def run_child(data_dir: str, build_args: list) -> dict:
+    mod = load_build_module()
+    stages = {}
+    rows = {"points": 0, "islands": 0, "regions": 0}
+
+    for name in STAGES:
+        setattr(mod, name, timed(stages, name, getattr(mod, name)))
+    mod.pd.read_csv = timed(stages, "read_csv", mod.pd.read_csv)
+    mod.folium.Figure.render = timed(stages, "render", mod.folium.Figure.render)
+
+    # 出力される点の数（クライアントで JS オブジェクトになる行）
+    layer_payload, area_payload = mod.layer_payload, mod.area_payload
+    def count_layer(pts, *a, **kw):
+        payload = layer_payload(pts, *a, **kw)
+        rows["points"] += len(payload["rows"])
+        return payload
+    def count_area(*a, **kw):
+        payload = area_payload(*a, **kw)
+        rows["islands"] += len(payload["islands"])
+        rows["regions"] += len(payload["regions"])
+        return payload
+    mod.layer_payload, mod.area_payload = count_layer, count_area
+
+    os.chdir(data_dir)
+    args = mod.parse_args(build_args)
+    t0 = time.perf_counter()
+    mod.build(args)
+    total = time.perf_counter() - t0
+
+    with open(mod.OUTPUT_HTML, "rb") as f:
+        html = f.read()
+    result = {
+        "total_seconds": total,
+        "stages": stages,
+        "html_bytes": len(html),
+        "html_gzip_bytes": len(gzip.compress(html, 6, mtime=0)),
+        "js_objects": dict(rows, layers=len(re.findall(rb"L\.featureGroup\(", html))),
+    }
+    try:
+        import resource
+        scale = 1 if sys.platform == "darwin" else 1024  # macOS は bytes、Linux は KiB
+        result["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20, 1)
+    except ImportError:  # Windows
+        pass
+    return result
+
+def run_size(rows: int, build_args: list, seed: int) -> dict:
+    mod = load_build_module()
+    with tempfile.TemporaryDirectory(prefix=f"seto-bench-{rows}-") as tmp:
+        t0 = time.perf_counter()
+        counts = make_dataset(tmp, mod, rows, seed)
+        gen = time.perf_counter() - t0
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", tmp, "--build-args=" + shlex.join(build_args)],
+            capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"build failed at {rows} rows:\n{proc.stderr}")
+        result = json.loads(proc.stdout.splitlines()[-1])
+    result["csv_rows"] = counts
+    result["generate_seconds"] = gen
+    return result
+
+# =====================
+# 比較（--compare）
+# =====================
+COMPARE_KEYS = ["total_seconds", "peak_rss_mb", "html_bytes", "html_gzip_bytes"]
+
+def compare(old: dict, new: dict, threshold: float) -> list:
+    """threshold（比率）を超えて悪化した項目を返す"""
+    worse = []
+    for size, cur in new["sizes"].items():
+        prev = old.get("sizes", {}).get(size)
+        if not prev:
+            continue
+        for key in COMPARE_KEYS:
+            a, b = prev.get(key), cur.get(key)
+            if not a or b is None:
+                continue
+            ratio = b / a
+            mark = "  <-- worse" if ratio > 1 + threshold else ""
+            print(f"  {size:>8} {key:<16} {a:>12.3f} -> {b:>12.3f}  x{ratio:.2f}{mark}")
+            if mark:
+                worse.append((size, key, ratio))
+    return worse
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="make_seto-map.py のビルドを合成データで計測する")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="カテゴリごとの行数（カンマ区切り、既定 %(default)s）")
+    parser.add_argument("--build-args", default="", help='make_seto-map.py に渡すオプション（例 --build-args="--cluster --cull"）')
+    parser.add_argument("--out", default="bench-report.json", help="レポートの出力先（既定 %(default)s）")
+    parser.add_argument("--compare", metavar="OLD_JSON", help="前回のレポートと比べる")
+    parser.add_argument("--threshold", type=float, default=0.10, help="--compare で悪化とみなす比率（既定 %(default)s）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--child", metavar="DATA_DIR", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    build_args = shlex.split(args.build_args)
+    if args.child:
+        # build() の出力は stderr へ、結果の JSON だけ stdout の最終行に出す
+        stdout, sys.stdout = sys.stdout, sys.stderr
+        result = run_child(args.child, build_args)
+        print(json.dumps(result), file=stdout)
+        return
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "pandas": pd.__version__,
+        "build_args": build_args,
+        "sizes": {},
+    }
+    for rows in (int(v) for v in args.sizes.split(",")):
+        print(f"bench: {rows} rows ...", flush=True)
+        r = report["sizes"][str(rows)] = run_size(rows, build_args, args.seed)
+        print(f"  total {r['total_seconds']:.2f}s, html {r['html_bytes']:,} B"
+              f" (gzip {r['html_gzip_bytes']:,} B), rss {r.get('peak_rss_mb', '-')} MB")
+        for name, st in sorted(r["stages"].items(), key=lambda kv: -kv[1]["seconds"]):
+            print(f"    {name:<18} {st['seconds']:8.3f}s  x{st['calls']}")
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print("saved:", args.out)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            old = json.load(f)
+        print("compare:", args.compare)
+        if compare(old, report, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
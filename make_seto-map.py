@@ -1,568 +1,8 @@
-import pandas as pd
-import folium
-from folium.features import DivIcon
-from branca.element import MacroElement, Template
+"""瀬戸内マップ（seto-map.html）を生成する
 
-print("RUNNING:", __file__)
-
-# =====================
-# 設定
-# =====================
-NAME_ZOOM = 13  # PC基準：このズーム以上で「全島がname表示」
-
-# =====================
-# CSV読み込み
-# =====================
-df_sake    = pd.read_csv("sake.csv")
-df_jinja   = pd.read_csv("jinja.csv")
-df_arch    = pd.read_csv("architecture.csv")
-df_art     = pd.read_csv("art.csv")
-df_matsuri = pd.read_csv("matsuri.csv")
-df_cityscape = pd.read_csv("cityscape.csv")
-df_others   = pd.read_csv("others.csv")
-df_islands = pd.read_csv("islands.csv")   # min_zoom 列（任意）
-df_regions = pd.read_csv("regions.csv")
-
-# =====================
-# lat/lon 正規化（全CSV共通）
-# =====================
-def normalize_latlon(df: pd.DataFrame) -> pd.DataFrame:
-    # 必須列を用意
-    if "name" not in df.columns:
-        df["name"] = ""
-    if "lat" not in df.columns:
-        df["lat"] = pd.NA
-    if "lon" not in df.columns:
-        df["lon"] = pd.NA
-    if "url" not in df.columns:
-        df["url"] = ""
-
-    # 数値化（変換できないものは NaN）
-    df["lat"] = pd.to_numeric(df["lat"], errors="coerce")
-    df["lon"] = pd.to_numeric(df["lon"], errors="coerce")
-
-    # lat/lon が数値の行だけ残す
-    df = df.dropna(subset=["lat", "lon"]).copy()
-    return df
-
-df_sake    = normalize_latlon(df_sake)
-df_jinja   = normalize_latlon(df_jinja)
-df_arch    = normalize_latlon(df_arch)
-df_art     = normalize_latlon(df_art)
-df_matsuri = normalize_latlon(df_matsuri)
-df_cityscape = normalize_latlon(df_cityscape)
-df_others   = normalize_latlon(df_others)
-df_islands = normalize_latlon(df_islands)
-df_regions = normalize_latlon(df_regions)
-
-# =====================
-# 地図（ベース）
-# =====================
-m = folium.Map(
-    location=[34.295, 132.81],
-    zoom_start=12,
-    tiles=None
-)
-
-folium.TileLayer(
-    tiles="https://{s}.basemaps.cartocdn.com/light_nolabels/{z}/{x}/{y}{r}.png",
-    attr="© CARTO, © OpenStreetMap",
-    control=False
-).add_to(m)
-
-# =====================
-# レイヤー
-# =====================
-layer_sake    = folium.FeatureGroup(name="酒蔵・醸造所", show=False)
-layer_jinja   = folium.FeatureGroup(name="神社", show=False)
-layer_arch    = folium.FeatureGroup(name="建築", show=False)
-layer_cityscape = folium.FeatureGroup(name="街並み", show=False)
-layer_art     = folium.FeatureGroup(name="アート", show=False)
-layer_matsuri = folium.FeatureGroup(name="祭り", show=False)
-layer_others  = folium.FeatureGroup(name="その他", show=False)
-layer_area    = folium.FeatureGroup(name="地域・島", show=False)
-layer_otafuku = folium.FeatureGroup(name="柄酒造", show=True)  # 常時表示
-
-# =====================
-# サイズ
-# =====================
-size = 8
-size_otafuku = 10
-size_arch = 8
-size_cityscape = 8
-size_art = 8
-size_matsuri = 9
-size_others = 8
-
-# =====================
-# 共通：ラベルHTML（regions と islands を揃える）
-# =====================
-def label_html(name: str) -> str:
-    name = str(name).strip()
-    return f"""
-    <div style="
-      font-size:9px;
-      color:rgba(0,0,0,0.6);
-      white-space:nowrap;
-      text-align:center;
-      text-shadow:0 0 3px rgba(255,255,255,0.9);
-      pointer-events:none;
-    ">{name}</div>
-    """
-
-# =====================
-# 酒蔵（柄酒造だけ別レイヤー＆サイズ）
-# =====================
-for _, r in df_sake.iterrows():
-    name = str(r.get("name", "")).strip()
-    lat = float(r["lat"])
-    lon = float(r["lon"])
-
-    x_url = ""
-    if "x_url" in df_sake.columns and pd.notna(r.get("x_url", "")):
-        x_url = str(r.get("x_url", "")).strip()
-
-    insta_url = ""
-    if "instagram_url" in df_sake.columns and pd.notna(r.get("instagram_url", "")):
-        insta_url = str(r.get("instagram_url", "")).strip()
-
-    is_otafuku = ("柄酒造" in name)
-    color = "#c40000" if is_otafuku else "#0066cc"
-    this_size = size_otafuku if is_otafuku else size
-
-    title = f'<a href="{x_url}" target="_blank" rel="noopener noreferrer">{name}</a>' if x_url else name
-
-    extra = ""
-    if is_otafuku and insta_url:
-        extra = f'''
-        <div style="margin-top:6px;">
-          <a href="{insta_url}" target="_blank" rel="noopener noreferrer"
-             style="display:inline-flex; align-items:center; justify-content:center;">
-            <svg width="20" height="20" viewBox="0 0 24 24" aria-label="Instagram">
-              <path fill="rgba(0,0,0,0.65)" d="M7 2h10a5 5 0 0 1 5 5v10a5 5 0 0 1-5 5H7a5 5 0 0 1-5-5V7a5 5 0 0 1 5-5zm10 2H7a3 3 0 0 0-3 3v10a3 3 0 0 0 3 3h10a3 3 0 0 0 3-3V7a3 3 0 0 0-3-3zm-5 4.5A5.5 5.5 0 1 1 6.5 14 5.5 5.5 0 0 1 12 8.5zm0 2A3.5 3.5 0 1 0 15.5 14 3.5 3.5 0 0 0 12 10.5zM18 6.8a1.2 1.2 0 1 1-1.2 1.2A1.2 1.2 0 0 1 18 6.8z"/>
-            </svg>
-          </a>
-        </div>
-        '''
-
-    popup_html = f"""
-    <div style="text-align:center;font-size:13px;line-height:1.35;">
-      <div>{title}</div>
-      {extra}
-    </div>
-    """
-
-    marker = folium.Marker(
-        location=[lat, lon],
-        icon=DivIcon(
-            icon_size=(this_size, this_size),
-            icon_anchor=(this_size // 2, this_size // 2),
-            popup_anchor=(0, -this_size // 2),
-            html=f"""<div style="width:{this_size}px;height:{this_size}px;background:{color};opacity:0.4;"></div>"""
-        ),
-        popup=folium.Popup(popup_html, max_width=240)
-    )
-
-    (marker.add_to(layer_otafuku) if is_otafuku else marker.add_to(layer_sake))
-
-# =====================
-# 神社
-# =====================
-for _, r in df_jinja.iterrows():
-    name = str(r.get("name", "")).strip()
-    lat = float(r["lat"])
-    lon = float(r["lon"])
-    url = str(r.get("url", "")).strip() if pd.notna(r.get("url", "")) else ""
-
-    popup_html = name if not url else f'<a href="{url}" target="_blank" rel="noopener noreferrer">{name}</a>'
-
-    folium.Marker(
-        location=[lat, lon],
-        icon=DivIcon(
-            icon_size=(size, size),
-            icon_anchor=(size // 2, size // 2),
-            popup_anchor=(0, -size // 2),
-            html=f"""<div style="width:{size}px;height:{size}px;background:#1a7f37;opacity:0.4;"></div>"""
-        ),
-        popup=folium.Popup(popup_html, max_width=260)
-    ).add_to(layer_jinja)
-
-# =====================
-# 建築（黄色）
-# =====================
-for _, r in df_arch.iterrows():
-    name = str(r.get("name", "")).strip()
-    lat = float(r["lat"])
-    lon = float(r["lon"])
-    url = str(r.get("url", "")).strip() if pd.notna(r.get("url", "")) else ""
-
-    popup_html = name if not url else f'<a href="{url}" target="_blank" rel="noopener noreferrer">{name}</a>'
-
-    folium.Marker(
-        location=[lat, lon],
-        icon=DivIcon(
-            icon_size=(size_arch, size_arch),
-            icon_anchor=(size_arch // 2, size_arch // 2),
-            popup_anchor=(0, -size_arch // 2),
-            html=f"""<div style="width:{size_arch}px;height:{size_arch}px;background:#f2c300;opacity:0.4;"></div>"""
-        ),
-        popup=folium.Popup(popup_html, max_width=320)
-    ).add_to(layer_arch)
-
-
-# =====================
-# 街並み（スレートブルー）
-# =====================
-for _, r in df_cityscape.iterrows():
-    name = str(r.get("name", "")).strip()
-    lat = float(r["lat"])
-    lon = float(r["lon"])
-    url = str(r.get("url", "")).strip() if pd.notna(r.get("url", "")) else ""
-
-    popup_html = name if not url else f'<a href="{url}" target="_blank" rel="noopener noreferrer">{name}</a>'
-
-    folium.Marker(
-        location=[lat, lon],
-        icon=DivIcon(
-            icon_size=(size_cityscape, size_cityscape),
-            icon_anchor=(size_cityscape // 2, size_cityscape // 2),
-            popup_anchor=(0, -size_cityscape // 2),
-            html=f"""<div style="width:{size_cityscape}px;height:{size_cityscape}px;background:#8a6f5b;opacity:0.45;"></div>"""
-        ),
-        popup=folium.Popup(popup_html, max_width=320)
-    ).add_to(layer_cityscape)
-
-# =====================
-# アート（紫）
-# =====================
-for _, r in df_art.iterrows():
-    name = str(r.get("name", "")).strip()
-    lat = float(r["lat"])
-    lon = float(r["lon"])
-    url = str(r.get("url", "")).strip() if pd.notna(r.get("url", "")) else ""
-
-    popup_html = name if not url else f'<a href="{url}" target="_blank" rel="noopener noreferrer">{name}</a>'
-
-    folium.Marker(
-        location=[lat, lon],
-        icon=DivIcon(
-            icon_size=(size_art, size_art),
-            icon_anchor=(size_art // 2, size_art // 2),
-            popup_anchor=(0, -size_art // 2),
-            html=f"""<div style="width:{size_art}px;height:{size_art}px;background:#8e44ad;opacity:0.4;"></div>"""
-        ),
-        popup=folium.Popup(popup_html, max_width=320)
-    ).add_to(layer_art)
-
-# =====================
-# 祭り（橙）
-# =====================
-for _, r in df_matsuri.iterrows():
-    name = str(r.get("name", "")).strip()
-    lat = float(r["lat"])
-    lon = float(r["lon"])
-    url = str(r.get("url", "")).strip() if pd.notna(r.get("url", "")) else ""
-
-    popup_html = name if not url else f'<a href="{url}" target="_blank" rel="noopener noreferrer">{name}</a>'
-
-    folium.Marker(
-        location=[lat, lon],
-        icon=DivIcon(
-            icon_size=(size_matsuri, size_matsuri),
-            icon_anchor=(size_matsuri // 2, size_matsuri // 2),
-            popup_anchor=(0, -size_matsuri // 2),
-            html=f"""<div style="width:{size_matsuri}px;height:{size_matsuri}px;background:#d16c00;opacity:0.45;"></div>"""
-        ),
-        popup=folium.Popup(popup_html, max_width=360)
-    ).add_to(layer_matsuri)
-
-
-# =====================
-# その他（枠赤）
-# =====================
-for _, r in df_others.iterrows():
-    name = str(r.get("name", "")).strip()
-    lat = float(r["lat"])
-    lon = float(r["lon"])
-    url = str(r.get("url", "")).strip() if pd.notna(r.get("url", "")) else ""
-
-    popup_html = name if not url else f'<a href="{url}" target="_blank" rel="noopener noreferrer">{name}</a>'
-
-    folium.Marker(
-        location=[lat, lon],
-        icon=DivIcon(
-            icon_size=(size_others, size_others),
-            icon_anchor=(size_others // 2, size_others // 2),
-            popup_anchor=(0, -size_others // 2),
-            html=f"""<div style="width:{size_others}px;height:{size_others}px;box-sizing:border-box;border:1.5px solid rgba(196,0,0,0.7);background:transparent;border-radius:1px;"></div>"""
-        ),
-        popup=folium.Popup(popup_html, max_width=320)
-    ).add_to(layer_others)
-
-
-# =====================
-# 地域・島（濃いグレー）
-# - 島：ズームで dot / name / 非表示 を切り替え（min_zoom）
-# - zoom>=NAME_ZOOM で「全島 name」
-# - スマホは NAME_ZOOM と min_zoom を -2 して広域で出す
-# =====================
-area_color = "#3a3a3a"
-island_rules = []  # (dot_var, label_var, min_zoom_or_None)
-
-for _, r in df_islands.iterrows():
-    name = str(r.get("name", "")).strip()
-    lat = float(r["lat"])
-    lon = float(r["lon"])
-
-    min_zoom = None
-    if "min_zoom" in df_islands.columns and pd.notna(r.get("min_zoom", "")) and str(r.get("min_zoom", "")).strip() != "":
-        try:
-            min_zoom = int(float(r.get("min_zoom")))
-        except Exception:
-            min_zoom = None
-
-    dot = folium.CircleMarker(
-        location=[lat, lon],
-        radius=3,
-        color=area_color,
-        weight=0,
-        fill=True,
-        fill_color=area_color,
-        fill_opacity=0.3,
-        popup=folium.Popup(name, max_width=220)
-    ).add_to(layer_area)
-
-    label = folium.Marker(
-        location=[lat, lon],
-        icon=DivIcon(
-            icon_size=(240, 24),
-            icon_anchor=(120, 12),
-            html=label_html(name)
-        )
-    ).add_to(layer_area)
-
-    island_rules.append((dot.get_name(), label.get_name(), min_zoom))
-
-# 地域：name 常時表示（トグル内）
-for _, r in df_regions.iterrows():
-    name = str(r.get("name", "")).strip()
-    lat = float(r["lat"])
-    lon = float(r["lon"])
-
-    folium.Marker(
-        location=[lat, lon],
-        icon=DivIcon(
-            icon_size=(240, 24),
-            icon_anchor=(120, 12),
-            html=label_html(name)
-        )
-    ).add_to(layer_area)
-
-# =====================
-# 地図に追加（順番重要）
-# =====================
-layer_sake.add_to(m)
-layer_jinja.add_to(m)
-layer_arch.add_to(m)
-layer_cityscape.add_to(m)
-layer_art.add_to(m)
-layer_matsuri.add_to(m)
-layer_area.add_to(m)
-layer_others.add_to(m)
-layer_otafuku.add_to(m)
-
-# =====================
-# JS埋め込み用：island_rules
-# =====================
-def js_minzoom(v):
-    return "null" if v is None else str(int(v))
-
-island_rules_js = ", ".join(
-    [f"{{dot:{d}, label:{l}, minz:{js_minzoom(mz)}}}" for d, l, mz in island_rules]
-)
-
-# =====================
-# 右上 UI（Layers）＋ 島表示制御（スマホ調整込み）
-# =====================
-map_var = m.get_name()
-sake_var = layer_sake.get_name()
-jinja_var = layer_jinja.get_name()
-arch_var = layer_arch.get_name()
-art_var = layer_art.get_name()
-matsuri_var = layer_matsuri.get_name()
-cityscape_var = layer_cityscape.get_name()
-others_var = layer_others.get_name()
-area_var = layer_area.get_name()
-
-template = f"""
-{{% macro html(this, kwargs) %}}
-<style>
-.toggle-box {{
-  position:absolute; top:12px; right:12px; z-index:9999;
-  background:rgba(255,255,255,0.92);
-  border:1px solid rgba(0,0,0,0.15);
-  border-radius:10px; padding:10px; min-width:160px;
-  box-shadow:0 8px 24px rgba(0,0,0,0.12);
-  font-family:system-ui, sans-serif;
-}}
-.toggle-title {{ font-size:12px; color:rgba(0,0,0,0.45); padding-bottom:6px; }}
-.toggle-item {{ display:flex; align-items:center; gap:10px; padding:8px; border-radius:8px; cursor:pointer; user-select:none; }}
-.toggle-item:hover {{ background:rgba(0,0,0,0.04); }}
-.sq {{ width:10px; height:10px; border-radius:2px; background:rgba(160,160,160,0.25); }}
-.label {{ font-size:13px; color:rgba(0,0,0,0.78); }}
-
-.on-otafuku .sq {{ background:rgba(196,0,0,0.5); }}
-.on-sake .sq {{ background:rgba(0,102,204,0.5); }}
-.on-jinja .sq {{ background:rgba(26,127,55,0.5); }}
-.on-arch .sq {{ background:rgba(242,195,0,0.5); }}
-.on-cityscape .sq {{ background:rgba(138,111,91,0.55); }}
-.on-art  .sq {{ background:rgba(142,68,173,0.5); }}
-.on-matsuri .sq {{ background:rgba(209,108,0,0.6); }}
-.on-others .sq {{ background:transparent;border:1.5px solid rgba(196,0,0,0.7);box-sizing:border-box; }}
-.on-area .sq {{ background:rgba(58,58,58,0.55); }}
-
-.toggle-static {{ cursor:default; }}
-.toggle-static:hover {{ background:transparent; }}
-
-@media (max-width:600px) {{
-  .toggle-box {{ top:8px; right:8px; padding:6px; min-width:120px; opacity:0.88; }}
-  .toggle-title {{ font-size:10px; padding-bottom:4px; }}
-  .toggle-item {{ padding:5px 6px; gap:6px; }}
-  .label {{ font-size:11px; }}
-  .sq {{ width:8px; height:8px; }}
-}}
-</style>
-
-<div class="toggle-box" id="customToggle">
-  <div class="toggle-title">Layers</div>
-  <div class="toggle-item toggle-static on-otafuku"><span class="sq"></span><span class="label">柄酒造</span></div>
-  <div class="toggle-item" id="btn-sake"><span class="sq"></span><span class="label">酒蔵・醸造所</span></div>
-  <div class="toggle-item" id="btn-jinja"><span class="sq"></span><span class="label">神社</span></div>
-  <div class="toggle-item" id="btn-arch"><span class="sq"></span><span class="label">建築</span></div>
-  <div class="toggle-item" id="btn-cityscape"><span class="sq"></span><span class="label">街並み</span></div>
-  <div class="toggle-item" id="btn-art"><span class="sq"></span><span class="label">アート</span></div>
-  <div class="toggle-item" id="btn-matsuri"><span class="sq"></span><span class="label">祭り</span></div>
-  <div class="toggle-item" id="btn-others"><span class="sq"></span><span class="label">その他</span></div>
-  <div class="toggle-item" id="btn-area"><span class="sq"></span><span class="label">地域・島</span></div>
-</div>
-
-<script>
-(function(){{
-  function init() {{
-    var map = {map_var};
-    var ls = {sake_var};
-    var lj = {jinja_var};
-    var larch = {arch_var};
-    var lcity = {cityscape_var};
-    var lart = {art_var};
-    var lm = {matsuri_var};
-    var lothers = {others_var};
-    var larea = {area_var};
-
-    var bs=document.getElementById("btn-sake"),
-        bj=document.getElementById("btn-jinja"),
-        ba=document.getElementById("btn-arch"),
-        bc=document.getElementById("btn-cityscape"),
-        bt=document.getElementById("btn-art"),
-        bm=document.getElementById("btn-matsuri"),
-        bo=document.getElementById("btn-others"),
-        br=document.getElementById("btn-area"),
-        box=document.getElementById("customToggle");
-
-    if(!bs||!bj||!ba||!bc||!bt||!bm||!bo||!br||!box||typeof map==="undefined"){{setTimeout(init,50);return;}}
-
-    if(window.L&&L.DomEvent){{L.DomEvent.disableClickPropagation(box);L.DomEvent.disableScrollPropagation(box);}}
-
-    function set(b,on,c){{on?b.classList.add(c):b.classList.remove(c);}}
-    function safeHas(layer){{ try {{ return map.hasLayer(layer); }} catch(e){{ return false; }} }}
-    function toggle(layer, btn, cls){{
-      if(!layer) return;
-      if(safeHas(layer)){{ map.removeLayer(layer); set(btn,false,cls); }}
-      else {{ map.addLayer(layer); set(btn,true,cls); }}
-    }}
-
-    // 初期状態の色
-    set(bs,safeHas(ls),"on-sake");
-    set(bj,safeHas(lj),"on-jinja");
-    set(ba,safeHas(larch),"on-arch");
-    set(bc,safeHas(lcity),"on-cityscape");
-    set(bt,safeHas(lart),"on-art");
-    set(bm,safeHas(lm),"on-matsuri");
-    set(bo,safeHas(lothers),"on-others");
-    set(br,safeHas(larea),"on-area");
-
-    // ===== スマホは広域で島名を出す =====
-    var NAME_ZOOM_BASE = {NAME_ZOOM};
-    var isMobile = window.matchMedia && window.matchMedia("(max-width: 600px)").matches;
-    var NAME_ZOOM = isMobile ? (NAME_ZOOM_BASE - 0.5) : NAME_ZOOM_BASE;
-    var mobileBoost = isMobile ? 0.5 : 0;
-
-    var islandRules = [{island_rules_js}];
-
-    function applyIslandRules(){{
-      if(!safeHas(larea)) return;
-      var z = map.getZoom();
-
-      islandRules.forEach(function(r){{
-        // 全島name
-        if(z >= NAME_ZOOM){{
-          if(safeHas(r.dot)) map.removeLayer(r.dot);
-          if(!safeHas(r.label)) r.label.addTo(map);
-          return;
-        }}
-
-        // min_zoom 指定島
-        if(r.minz !== null){{
-          var minz = r.minz - mobileBoost;
-          if(z < minz){{
-            if(safeHas(r.dot)) map.removeLayer(r.dot);
-            if(safeHas(r.label)) map.removeLayer(r.label);
-          }} else {{
-            if(safeHas(r.dot)) map.removeLayer(r.dot);
-            if(!safeHas(r.label)) r.label.addTo(map);
-          }}
-        }} else {{
-          // 通常島は dot
-          if(!safeHas(r.dot)) r.dot.addTo(map);
-          if(safeHas(r.label)) map.removeLayer(r.label);
-        }}
-      }});
-    }}
-
-    applyIslandRules();
-    map.on("zoomend", applyIslandRules);
-
-    // トグル
-    bs.onclick=function(){{ toggle(ls, bs, "on-sake"); }};
-    bj.onclick=function(){{ toggle(lj, bj, "on-jinja"); }};
-    ba.onclick=function(){{ toggle(larch, ba, "on-arch"); }};
-    bc.onclick=function(){{ toggle(lcity, bc, "on-cityscape"); }};
-    bt.onclick=function(){{ toggle(lart, bt, "on-art"); }};
-    bm.onclick=function(){{ toggle(lm, bm, "on-matsuri"); }};
-    bo.onclick=function(){{ toggle(lothers, bo, "on-others"); }};
-    br.onclick=function(){{
-      if(safeHas(larea)) {{
-        map.removeLayer(larea);
-        set(br,false,"on-area");
-      }} else {{
-        map.addLayer(larea);
-        set(br,true,"on-area");
-        applyIslandRules();
-      }}
-    }};
-  }}
-  if(document.readyState==="loading")document.addEventListener("DOMContentLoaded",init);else init();
-}})();
-</script>
-{{% endmacro %}}
+中身は seto_map.py（import すれば build_map() で HTML を文字列で作れる。--serve でローカル配信）。
 """
+from seto_map import main
 
-control = MacroElement()
-control._template = Template(template)
-m.get_root().add_child(control)
-
-# =====================
-# 保存
-# =====================
-m.save("seto-map.html")
-print("saved: seto-map.html")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2885 @@
+"""
+瀬戸内マップ（seto-map.html）の生成
+
+  python make_seto-map.py [オプション]          # seto-map.html を書く（--help）
+  python make_seto-map.py --serve 8000          # ローカル配信（クエリでレイヤー・範囲を選ぶ）
+
+  import seto_map
+  html = seto_map.build_map({"layers": ["sake"], "bbox": [34.2, 132.6, 34.5, 133.0]})
+
+import してもファイルの読み書きはしない（CSV を読むのは build() / build_map() / serve() を呼んだとき）。
+"""
+import argparse
+import base64
+import cProfile
+import filecmp
+import functools
+import gzip
+import hashlib
+import html
+import importlib.util
+import json
+import os
+import re
+import shutil
+import time
+import threading
+import tracemalloc
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import folium
+from branca.element import MacroElement, Template
+from folium.template import Template as FoliumTemplate
+
+try:
+    import brotli  # 任意：あれば --precompress で .br も書く
+except ImportError:
+    brotli = None
+
+try:
+    import pykakasi  # 任意：あれば --search の索引にローマ字読みも入れる
+except ImportError:
+    pykakasi = None
+
+try:
+    from scipy.spatial import cKDTree  # 任意：あれば --nearby を KD 木で探す
+except ImportError:
+    cKDTree = None
+
+# =====================
+# 設定
+# =====================
+NAME_ZOOM = 13  # PC基準：このズーム以上で「全島がname表示」
+MOBILE_ZOOM_BOOST = 0.5  # スマホは NAME_ZOOM と min_zoom をこれだけ下げて広域で出す
+
+# =====================
+# レイヤー定義（1行 = 1レイヤー）
+# - csv        : 読み込むCSV（同じCSVを複数レイヤーで共有してよい）
+# - link       : タイトルのリンク先に使う列
+# - match      : name にこの文字列を含む行だけ使う
+# - exclude    : name にこの文字列を含む行を除く
+# - border     : 指定すると塗りなし・枠線だけの四角
+# - centered   : ポップアップを中央寄せの枠で囲む
+# - instagram  : instagram_url をアイコンリンクで出す
+# - static     : トグルできない（常時表示、UIは凡例のみ）
+# - on_top     : 地域・島より上に重ねる
+# 並び順 = UI の並び順（地図への追加順は on_top のものが最後）
+# =====================
+LAYERS = [
+    dict(key="otafuku", name="柄酒造", csv="sake.csv", link="x_url", match="柄酒造",
+         color="#c40000", size=10, opacity=0.4, popup_width=240, show=True,
+         centered=True, instagram=True, static=True, on_top=True),
+    dict(key="sake", name="酒蔵・醸造所", csv="sake.csv", link="x_url", exclude="柄酒造",
+         color="#0066cc", size=8, opacity=0.4, popup_width=240, show=False, centered=True),
+    dict(key="jinja", name="神社", csv="jinja.csv",
+         color="#1a7f37", size=8, opacity=0.4, popup_width=260, show=False),
+    dict(key="temple", name="寺院", csv="temple.csv",
+         color="#4b5d23", size=8, opacity=0.4, popup_width=260, show=False),
+    dict(key="arch", name="建築", csv="architecture.csv",
+         color="#f2c300", size=8, opacity=0.4, popup_width=320, show=False),
+    dict(key="cityscape", name="街並み", csv="cityscape.csv",
+         color="#8a6f5b", size=8, opacity=0.45, popup_width=320, show=False),
+    dict(key="art", name="アート", csv="art.csv",
+         color="#8e44ad", size=8, opacity=0.4, popup_width=320, show=False),
+    dict(key="matsuri", name="祭り", csv="matsuri.csv",
+         color="#d16c00", size=9, opacity=0.45, popup_width=360, show=False),
+    dict(key="onsen", name="温泉", csv="onsen.csv",
+         color="#d9468f", size=8, opacity=0.4, popup_width=320, show=False),
+    dict(key="others", name="その他", csv="others.csv",
+         color="#c40000", size=8, opacity=0.7, popup_width=320, show=False,
+         border="rgba(196,0,0,0.7)", on_top=True),
+]
+
+AREA_NAME = "地域・島"
+AREA_COLOR = "#3a3a3a"  # 濃いグレー
+ISLANDS_CSV = "islands.csv"   # min_zoom 列（任意）
+REGIONS_CSV = "regions.csv"
+
+OUTPUT_HTML = "seto-map.html"
+
+def side_dir(output: str, kind: str) -> str:
+    """出力HTMLの隣に置くデータの置き場（seto-map.html → seto-map-data / seto-map-tiles / seto-map-assets）
+    --lazy は side_dir(output, "data")、--tiles は side_dir(output, "tiles")"""
+    return os.path.splitext(os.path.basename(output))[0] + "-" + kind
+
+# =====================
+# lat/lon 正規化（全CSV共通）
+# =====================
+def normalize_latlon(df: pd.DataFrame) -> pd.DataFrame:
+    # 必須列を用意
+    if "name" not in df.columns:
+        df["name"] = ""
+    if "lat" not in df.columns:
+        df["lat"] = pd.NA
+    if "lon" not in df.columns:
+        df["lon"] = pd.NA
+    if "url" not in df.columns:
+        df["url"] = ""
+
+    # 数値化（変換できないものは NaN）
+    df["lat"] = pd.to_numeric(df["lat"], errors="coerce")
+    df["lon"] = pd.to_numeric(df["lon"], errors="coerce")
+
+    # lat/lon が数値の行だけ残す
+    df = df.dropna(subset=["lat", "lon"]).copy()
+    return df
+
+# =====================
+# 列単位の整形（iterrows を使わない）
+# =====================
+def text_column(df: pd.DataFrame, col: str) -> pd.Series:
+    # 列が無い / 欠損は ""、前後の空白を除去
+    if col not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    return df[col].astype(object).where(df[col].notna(), "").astype(str).str.strip()
+
+def layer_points(spec: dict, df: pd.DataFrame) -> pd.DataFrame:
+    """レイヤー定義に従って lat / lon / name / url（/ insta）の表を列単位で作る"""
+    name = text_column(df, "name")
+    keep = pd.Series(True, index=df.index)
+    if spec.get("match"):
+        keep &= name.str.contains(spec["match"], regex=False)
+    if spec.get("exclude"):
+        keep &= ~name.str.contains(spec["exclude"], regex=False)
+
+    df = df[keep]
+    pts = pd.DataFrame({
+        "lat": df["lat"].astype(float),
+        "lon": df["lon"].astype(float),
+        "name": name[keep],
+        "url": text_column(df, spec.get("link", "url")),
+    })
+    if spec.get("instagram"):
+        pts["insta"] = text_column(df, "instagram_url")
+    return pts
+
+def min_zoom_column(df: pd.DataFrame) -> pd.Series:
+    # min_zoom 列（任意）：整数に切り捨て、数値化できないものは <NA>
+    if "min_zoom" not in df.columns:
+        return pd.Series(pd.NA, index=df.index, dtype="Int64")
+    return np.trunc(pd.to_numeric(df["min_zoom"], errors="coerce")).astype("Int64")
+
+# =====================
+# 重複チェック（--dedupe）
+# - 全レイヤーの点を「正規化した name + 格子セル」で突き合わせる（総当たりしない）
+# - セルは 1辺 distance 以上なので、近い点は同じセルか隣のセルにいる（隣は片側 4方向だけ見る）
+# - name が空の行は突き合わせず、レイヤーごとの件数だけ報告
+# - 残すのは LAYERS の並びで先のレイヤー・CSV で先の行。merge は残す行の空の url を重複から埋める
+# =====================
+DEDUPE_METERS = 30
+EARTH_RADIUS = 6_371_000
+M_PER_DEG = np.pi * EARTH_RADIUS / 180
+EXACT_METERS = 0.1  # COORD_DIGITS の丸め以下は「同じ座標」
+
+def name_key(name: pd.Series) -> pd.Series:
+    """比較用の name：NFKC・大文字小文字・空白・記号（「・」「（）」など）を無視"""
+    return name.str.normalize("NFKC").str.casefold().str.replace(r"[\W_]+", "", regex=True)
+
+def plain_text(name: pd.Series) -> pd.Series:
+    """表示・検索用の name：タグ（<br> など）を外して実体参照を戻し、空白をまとめる"""
+    name = name.str.replace(r"<[^>]*>", " ", regex=True).map(html.unescape)
+    return name.str.replace(r"\s+", " ", regex=True).str.strip()
+
+def distance_m(lat1, lon1, lat2, lon2) -> np.ndarray:
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+def duplicate_pairs(pts: pd.DataFrame, meters: float) -> pd.DataFrame:
+    """pts（lat / lon / key）のうち key が同じで meters 以内の組 [a, b, meters]（a < b は pts の位置）"""
+    cos = max(np.cos(np.radians(pts["lat"].abs().max())), 0.01)  # 一番細いセルでも meters 以上に
+    cells = pd.DataFrame({
+        "key": pts["key"].to_numpy(),
+        "cx": np.floor(pts["lon"].to_numpy() * M_PER_DEG * cos / meters).astype(np.int64),
+        "cy": np.floor(pts["lat"].to_numpy() * M_PER_DEG / meters).astype(np.int64),
+        "i": np.arange(len(pts)),
+    })
+    found = []
+    for dx, dy in [(0, 0), (1, -1), (1, 0), (1, 1), (0, 1)]:
+        other = cells.assign(cx=cells["cx"] - dx, cy=cells["cy"] - dy)
+        pair = cells.merge(other, on=["key", "cx", "cy"], suffixes=("", "_b"))[["i", "i_b"]]
+        if (dx, dy) == (0, 0):
+            pair = pair[pair["i"] < pair["i_b"]]
+        found.append(pair)
+    pairs = pd.concat(found, ignore_index=True)
+    a, b = pairs["i"].to_numpy(), pairs["i_b"].to_numpy()
+    lat, lon = pts["lat"].to_numpy(), pts["lon"].to_numpy()
+    dist = distance_m(lat[a], lon[a], lat[b], lon[b])
+    near = dist <= meters
+    return pd.DataFrame({"a": np.minimum(a, b)[near], "b": np.maximum(a, b)[near], "meters": dist[near]})
+
+def find_duplicates(points: dict, meters: float = DEDUPE_METERS) -> dict:
+    """points（{レイヤーkey: layer_points の表}、LAYERS の並び）の重複を探す
+    groups：重複のまとまり、drop：{レイヤーkey: 落とす行}、fill：{レイヤーkey: [[行, url], ...]}"""
+    if not points:  # レイヤーが1つも無い（layers: [] のバリアントなど）
+        return {"distance": meters, "rows": 0, "blank_names": {}, "groups": [], "drop": {}, "fill": {}}
+    pts = pd.concat(
+        [p[["lat", "lon", "name", "url"]].assign(layer=k, row=p.index) for k, p in points.items()],
+        ignore_index=True
+    )
+    pts["key"] = name_key(pts["name"])
+    blank = pts["key"] == ""
+    report = {
+        "distance": meters,
+        "rows": len(pts),
+        "blank_names": {k: int(n) for k, n in pts[blank].groupby("layer", sort=False).size().items()},
+        "groups": [], "drop": {}, "fill": {},
+    }
+    pts = pts[~blank].reset_index(drop=True)
+    pairs = duplicate_pairs(pts, meters)
+
+    # 組をまとまりにする（union-find、組は重複の数しかない）
+    parent = {}
+    def root(i):
+        while parent.get(i, i) != i:
+            parent[i] = parent.get(parent[i], parent[i])
+            i = parent[i]
+        return i
+    for a, b in zip(pairs["a"].tolist(), pairs["b"].tolist()):
+        ra, rb = root(a), root(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)  # 根は一番先の行（= 残す行）
+    groups = {}
+    for i in sorted(parent):
+        groups.setdefault(root(i), [root(i)]).append(i)
+
+    for keep, members in sorted(groups.items()):
+        rows = pts.iloc[members]
+        dist = distance_m(rows["lat"].iloc[0], rows["lon"].iloc[0], rows["lat"], rows["lon"])
+        report["groups"].append({
+            "name": rows["name"].iloc[0],
+            "exact": bool(dist.max() < EXACT_METERS),
+            "members": [{"layer": r.layer, "row": int(r.row), "lat": r.lat, "lon": r.lon,
+                         "name": r.name, "url": r.url} for r in rows.itertuples()],
+        })
+        for r in rows.iloc[1:].itertuples():
+            report["drop"].setdefault(r.layer, []).append(int(r.row))
+        urls = [u for u in rows["url"].iloc[1:] if u]
+        if not rows["url"].iloc[0] and urls:
+            report["fill"].setdefault(rows["layer"].iloc[0], []).append([int(rows["row"].iloc[0]), urls[0]])
+    return report
+
+def drop_duplicates(pts: pd.DataFrame, key: str, dupes: dict = None, merge: bool = False) -> pd.DataFrame:
+    """find_duplicates の結果で layer_points の表から重複を落とす（merge なら空の url も埋める）"""
+    if not dupes:
+        return pts
+    if merge and dupes["fill"].get(key):
+        rows, urls = zip(*dupes["fill"][key])
+        fill = pd.Series(urls, index=rows)
+        pts = pts.assign(url=pts["url"].mask(pts.index.isin(fill.index), fill.reindex(pts.index)))
+    if dupes["drop"].get(key):
+        pts = pts[~pts.index.isin(dupes["drop"][key])]
+    return pts
+
+# =====================
+# 近くの POI（--nearby）
+# - 各点に、ほかのレイヤーの点を近い順に k 個（meters 以内）持たせる。中身は payload の行への参照だけ
+#   near[i] = [レイヤー番号, 行, m, ...]（番号は nearLayers の順、行はそのレイヤーの payload の行）
+# - scipy があれば単位球上の 3次元座標でレイヤーごとに cKDTree（弦の長さで探して大圏距離に直す）
+# - 無ければ 1辺 meters 以上の格子でセルごとに、近傍 9セルの点との距離をまとめて計算（NEARBY_CHUNK 要素ずつ）
+# =====================
+NEARBY_K = 3
+NEARBY_METERS = 5000
+NEARBY_CHUNK = 1 << 22
+
+def unit_xyz(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+def nearest_kdtree(lat, lon, layer, k: int, meters: float) -> tuple:
+    n = len(lat)
+    idx, dist = np.full((n, k), -1, dtype=np.int64), np.full((n, k), np.inf)
+    xyz = unit_xyz(lat, lon)
+    chord = 2 * np.sin(meters / (2 * EARTH_RADIUS))
+    for value in np.unique(layer):
+        own, others = np.flatnonzero(layer == value), np.flatnonzero(layer != value)
+        if not len(others):
+            continue
+        kk = min(k, len(others))
+        d, j = cKDTree(xyz[others]).query(xyz[own], k=kk, distance_upper_bound=chord)
+        d, j = d.reshape(len(own), kk), j.reshape(len(own), kk)
+        found = np.isfinite(d)
+        idx[own, :kk] = np.where(found, others[np.minimum(j, len(others) - 1)], -1)
+        dist[own, :kk] = np.where(found, 2 * EARTH_RADIUS * np.arcsin(np.minimum(d / 2, 1)), np.inf)
+    return idx, dist
+
+def nearest_grid(lat, lon, layer, k: int, meters: float) -> tuple:
+    n = len(lat)
+    idx, dist = np.full((n, k), -1, dtype=np.int64), np.full((n, k), np.inf)
+    cos = max(np.cos(np.radians(np.abs(lat).max())), 0.01)
+    cx = np.floor(lon * M_PER_DEG * cos / meters).astype(np.int64)
+    cy = np.floor(lat * M_PER_DEG / meters).astype(np.int64)
+    height = cy.max() - cy.min() + 3  # 上下に1セルずつ余白（隣の列に回り込まない）
+    cell = (cx - cx.min()) * height + (cy - cy.min() + 1)
+    order = np.argsort(cell, kind="stable")
+    cells, starts, counts = np.unique(cell[order], return_index=True, return_counts=True)
+
+    for c, start, count in zip(cells.tolist(), starts.tolist(), counts.tolist()):
+        around = [c + dx * height + dy for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+        pos = np.searchsorted(cells, around)
+        cand = np.concatenate([order[starts[p]:starts[p] + counts[p]]
+                               for p, a in zip(pos.tolist(), around) if p < len(cells) and cells[p] == a])
+        kk = min(k, len(cand))
+        step = max(1, NEARBY_CHUNK // len(cand))
+        for q0 in range(start, start + count, step):
+            q = order[q0:min(q0 + step, start + count)]
+            d = distance_m(lat[q][:, None], lon[q][:, None], lat[cand][None, :], lon[cand][None, :])
+            d[(layer[q][:, None] == layer[cand][None, :]) | (d > meters)] = np.inf
+            best = np.argpartition(d, kk - 1, axis=1)[:, :kk] if kk < len(cand) else np.tile(np.arange(kk), (len(q), 1))
+            bd = np.take_along_axis(d, best, axis=1)
+            sort = np.argsort(bd, axis=1, kind="stable")
+            best, bd = np.take_along_axis(best, sort, axis=1), np.take_along_axis(bd, sort, axis=1)
+            idx[q, :kk] = np.where(np.isfinite(bd), cand[best], -1)
+            dist[q, :kk] = bd
+    return idx, dist
+
+def nearby_refs(points: dict, k: int = NEARBY_K, meters: float = NEARBY_METERS) -> dict:
+    """points = {レイヤーkey: payload の順の点}（lat / lon）→ {レイヤーkey: {"layers": [...], "rows": near}}"""
+    keys = list(points)
+    sizes = [len(points[key]) for key in keys]
+    lat = np.concatenate([points[key]["lat"].to_numpy(float) for key in keys])
+    lon = np.concatenate([points[key]["lon"].to_numpy(float) for key in keys])
+    layer = np.repeat(np.arange(len(keys)), sizes)
+    row = np.concatenate([np.arange(size) for size in sizes])
+    if not len(lat):
+        return {key: {"layers": keys, "rows": []} for key in keys}
+
+    idx, dist = (nearest_kdtree if cKDTree is not None else nearest_grid)(lat, lon, layer, k, meters)
+    found = idx >= 0
+    safe = np.where(found, idx, 0)
+    refs = np.stack([layer[safe], row[safe], (np.round(np.where(found, dist, 0), -1)).astype(np.int64)], axis=2)
+    near = [r[f].ravel().tolist() for r, f in zip(refs, found)]
+    bounds = np.cumsum([0] + sizes)
+    return {key: {"layers": keys, "rows": near[bounds[i]:bounds[i + 1]]} for i, key in enumerate(keys)}
+
+# =====================
+# クラスタ（--cluster）
+# - Web メルカトルの正規化座標 [0,1) 上でグリッド集約
+# - CLUSTER_MAX_ZOOM から 1段ずつ、ひとつ上のズームの結果をさらに集約（階層になる）
+# - 1点だけのセルは元の点の index のまま、複数なら [lat, lon, 件数]
+# =====================
+CLUSTER_MIN_ZOOM = 5
+CLUSTER_MAX_ZOOM = 12   # これより上のズームは全点表示
+CLUSTER_RADIUS = 32     # px：この幅のセルにまとまる点を 1つにする
+
+def mercator_xy(lat: np.ndarray, lon: np.ndarray):
+    s = np.sin(np.radians(lat))
+    x = lon / 360.0 + 0.5
+    y = 0.5 - np.log((1 + s) / (1 - s)) / (4 * np.pi)
+    return x, np.clip(y, 0.0, 1.0)
+
+def mercator_latlon(x: np.ndarray, y: np.ndarray):
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y))))
+    return lat, (x - 0.5) * 360.0
+
+def cluster_levels(lat: np.ndarray, lon: np.ndarray,
+                   min_zoom: int = CLUSTER_MIN_ZOOM, max_zoom: int = CLUSTER_MAX_ZOOM,
+                   radius: int = CLUSTER_RADIUS) -> dict:
+    x, y = mercator_xy(lat, lon)
+    weight = np.ones(len(x))
+    ref = np.arange(len(x))  # 単独点なら元の index、クラスタなら -1
+
+    levels = {}
+    for z in range(max_zoom, min_zoom - 1, -1):
+        cell = radius / (256 * 2 ** z)
+        ncols = int(np.ceil(1 / cell)) + 1
+        keys = np.floor(y / cell).astype(np.int64) * ncols + np.floor(x / cell).astype(np.int64)
+        _, first, inv, counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+
+        w = np.bincount(inv, weights=weight)
+        x = np.bincount(inv, weights=x * weight) / w
+        y = np.bincount(inv, weights=y * weight) / w
+        ref = np.where(counts == 1, ref[first], -1)
+        weight = w
+
+        # まだ何もまとまっていないズームは省略（クライアントは全点表示）
+        if len(weight) == len(lat) and (ref >= 0).all():
+            continue
+
+        clat, clon = mercator_latlon(x, y)
+        items = [[a, b, int(c)] for a, b, c in zip(
+            clat.round(COORD_DIGITS).tolist(), clon.round(COORD_DIGITS).tolist(), weight.tolist())]
+        levels[z] = [int(r) if r >= 0 else item for r, item in zip(ref.tolist(), items)]
+
+    return {"minZoom": min_zoom, "maxZoom": max_zoom, "levels": levels}
+
+# =====================
+# 密度（--density）
+# - 全レイヤーの点を Web メルカトルの正規化座標上の六角形（pointy-top、外接円の半径 DENSITY_RADIUS px）に集計
+# - max_zoom は点から、そこから 1段ずつ、ひとつ上のズームのセルの中心をさらに集計（クラスタと同じ階層）
+# - セルごとにレイヤー別の件数を持ち、クライアントは出ているレイヤーの分だけ足して描く
+# =====================
+DENSITY_MIN_ZOOM = 5
+DENSITY_ZOOM = 12      # これ以下のズームは密度、より上はマーカー
+DENSITY_RADIUS = 20    # px
+DENSITY_NAME = "密度"
+
+def hex_cells(x: np.ndarray, y: np.ndarray, size: float) -> tuple:
+    """[0,1) の x, y を外接円の半径 size の六角形に丸め、axial 座標 (q, r) を返す"""
+    q = (np.sqrt(3) / 3 * x - y / 3) / size
+    r = (2 / 3 * y) / size
+    rq, rr, rs = np.round(q), np.round(r), np.round(-q - r)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs + q + r)
+    # いちばんずれた軸を残り2つから決め直す（cube 座標の丸め）
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return rq.astype(np.int64), rr.astype(np.int64)
+
+def density_levels(points: dict, min_zoom: int = DENSITY_MIN_ZOOM, max_zoom: int = DENSITY_ZOOM,
+                   radius: int = DENSITY_RADIUS) -> dict:
+    """points = {レイヤーkey: 点（lat / lon）} → levels[z] = [[lat, lon, 件数（layers の順）...], ...]"""
+    keys = list(points)
+    lat = np.concatenate([points[key]["lat"].to_numpy(float) for key in keys] or [np.empty(0)])
+    lon = np.concatenate([points[key]["lon"].to_numpy(float) for key in keys] or [np.empty(0)])
+    x, y = mercator_xy(lat, lon)
+    layer = np.repeat(np.arange(len(keys)), [len(points[key]) for key in keys])
+    counts = None  # ひとつ上のズームのセルごとの件数
+
+    levels = {}
+    for z in range(max_zoom, min(min_zoom, max_zoom) - 1, -1):
+        size = radius / (256 * 2 ** z)
+        q, r = hex_cells(x, y, size)
+        _, first, inv = np.unique((r << 32) + q, return_index=True, return_inverse=True)
+        if counts is None:
+            counts = np.bincount(inv * len(keys) + layer, minlength=len(first) * len(keys))
+        else:
+            flat = (inv[:, None] * len(keys) + np.arange(len(keys))).ravel()
+            counts = np.bincount(flat, weights=counts.ravel(), minlength=len(first) * len(keys))
+        counts = counts.reshape(len(first), len(keys)).astype(np.int64)
+        q, r = q[first], r[first]
+        x, y = size * np.sqrt(3) * (q + r / 2), size * 1.5 * r
+
+        clat, clon = mercator_latlon(x, y)
+        levels[z] = [[a, b, *c] for a, b, c in zip(
+            clat.round(COORD_DIGITS).tolist(), clon.round(COORD_DIGITS).tolist(), counts.tolist())]
+
+    return {"minZoom": min(min_zoom, max_zoom), "maxZoom": max_zoom, "radius": radius, "layers": keys,
+            "levels": levels}
+
+# =====================
+# 表示範囲での間引き（--cull）
+# - 点をヒルベルト曲線順に並べ、CULL_BLOCK 点ごとの外接矩形を index として持つ
+# - クライアントは moveend で表示範囲（CULL_PAD だけ広げる）に重なるブロックだけ調べる
+# =====================
+CULL_BLOCK = 64
+CULL_PAD = 0.5       # 表示範囲の幅・高さに対する割合
+HILBERT_ORDER = 16   # 2^16 x 2^16 の格子（ズーム16相当の解像度）
+
+def hilbert_index(x: np.ndarray, y: np.ndarray, order: int = HILBERT_ORDER) -> np.ndarray:
+    """[0,1) の x, y をヒルベルト曲線上の位置に変換（全点まとめて 1ビットずつ）"""
+    n = 1 << order
+    xi = np.clip((x * n).astype(np.int64), 0, n - 1)
+    yi = np.clip((y * n).astype(np.int64), 0, n - 1)
+    d = np.zeros(len(xi), dtype=np.int64)
+    s = n >> 1
+    while s > 0:
+        rx = ((xi & s) > 0).astype(np.int64)
+        ry = ((yi & s) > 0).astype(np.int64)
+        d += s * s * ((3 * rx) ^ ry)
+        # 象限に合わせて回転
+        flip = (ry == 0) & (rx == 1)
+        xi = np.where(flip, n - 1 - xi, xi)
+        yi = np.where(flip, n - 1 - yi, yi)
+        swap = ry == 0
+        xi, yi = np.where(swap, yi, xi), np.where(swap, xi, yi)
+        s >>= 1
+    return d
+
+def spatial_order(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    return np.argsort(hilbert_index(*mercator_xy(lat, lon)), kind="stable")
+
+def block_index(lat: np.ndarray, lon: np.ndarray, block: int = CULL_BLOCK) -> dict:
+    """block 点ごとの外接矩形 [south, west, north, east] を平らに並べたもの"""
+    starts = np.arange(0, len(lat), block)
+    boxes = []
+    if len(starts):
+        boxes = np.column_stack([
+            np.minimum.reduceat(lat, starts), np.minimum.reduceat(lon, starts),
+            np.maximum.reduceat(lat, starts), np.maximum.reduceat(lon, starts),
+        ]).round(COORD_DIGITS).ravel().tolist()
+    return {"block": block, "pad": CULL_PAD, "boxes": boxes}
+
+# =====================
+# JS埋め込み（点はクライアント側で生成する）
+# - 1レイヤー = [lat, lon, name, url] の配列 1つ + 共通スタイル 1つ
+# =====================
+COORD_DIGITS = 6  # 約 0.1m
+
+def to_js(obj) -> str:
+    # <script> 内にそのまま埋め込める compact JSON
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/")
+
+def write_js(f, obj) -> None:
+    """to_js(obj) と同じ文字列を f に少しずつ書く（全体の文字列を作らない）"""
+    # "<" は文字列の中にしか出ず、文字列は1片で出てくるので片ごとに置き換えてよい
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+    for chunk in encoder.iterencode(obj):
+        f.write(chunk.replace("</", "<\\/"))
+
+def layer_rows(pts: pd.DataFrame) -> list:
+    cols = [pts["lat"].round(COORD_DIGITS).tolist(), pts["lon"].round(COORD_DIGITS).tolist()]
+    cols += [pts[c].tolist() for c in pts.columns[2:]]
+    return list(zip(*cols))
+
+def payload_points(pts: pd.DataFrame, cull: bool = False) -> pd.DataFrame:
+    """layer_payload() の rows の順に並べた pts（cull なら空間順。並べ済みのものはそのまま）"""
+    if cull:
+        pts = pts.iloc[spatial_order(pts["lat"].to_numpy(), pts["lon"].to_numpy())]
+    return pts
+
+def layer_payload(pts: pd.DataFrame, cluster: bool = False, cull: bool = False, near: dict = None) -> dict:
+    """pointLayer に渡すデータ：rows = [lat, lon, name, url(, insta)] の配列
+    （cluster なら clusters、cull なら空間順に並べ替えて index も、near は nearby_refs() の1レイヤー分）"""
+    pts = payload_points(pts, cull)
+    payload = {"rows": layer_rows(pts)}
+    if near:
+        payload["near"], payload["nearLayers"] = near["rows"], near["layers"]
+    if cluster:
+        payload["clusters"] = cluster_levels(pts["lat"].to_numpy(), pts["lon"].to_numpy())
+    if cull:
+        payload["index"] = block_index(pts["lat"].to_numpy(), pts["lon"].to_numpy())
+    return payload
+
+def layer_style(spec: dict, canvas: bool = False, density: int = None) -> dict:
+    style = {
+        "key": spec["key"],
+        "size": spec["size"],
+        "color": spec["color"],
+        "opacity": spec["opacity"],
+        "popupWidth": spec["popup_width"],
+    }
+    for key in ("border", "centered"):
+        if spec.get(key):
+            style[key] = spec[key]
+    if canvas:
+        style["canvas"] = True
+    if density is not None:
+        style["densityZoom"] = density
+    return style
+
+RUNTIME_JS = """
+window.SetoMap = (function(){
+  var LINK = ' target="_blank" rel="noopener noreferrer"';
+  var INSTAGRAM_SVG = '<svg width="20" height="20" viewBox="0 0 24 24" aria-label="Instagram">'
+    + '<path fill="rgba(0,0,0,0.65)" d="M7 2h10a5 5 0 0 1 5 5v10a5 5 0 0 1-5 5H7a5 5 0 0 1-5-5V7a5 5 0 0 1 5-5zm10 2H7a3 3 0 0 0-3 3v10a3 3 0 0 0 3 3h10a3 3 0 0 0 3-3V7a3 3 0 0 0-3-3zm-5 4.5A5.5 5.5 0 1 1 6.5 14 5.5 5.5 0 0 1 12 8.5zm0 2A3.5 3.5 0 1 0 15.5 14 3.5 3.5 0 0 0 12 10.5zM18 6.8a1.2 1.2 0 1 1-1.2 1.2A1.2 1.2 0 0 1 18 6.8z"/>'
+    + '</svg>';
+
+  function link(url, text){ return url ? '<a href="' + url + '"' + LINK + '>' + text + '</a>' : text; }
+
+  // 一覧に出す name：plain_text() と同じくタグを外して実体参照を戻す（popup は HTML のまま）
+  var ENTITIES = {amp: "&", lt: "<", gt: ">", quot: '"', apos: "'", nbsp: " "};
+  function plainText(s){
+    return s.replace(/<[^>]*>/g, " ").replace(/&(#x[0-9a-f]+|#\\d+|\\w+);/gi, function(m, e){
+      if(e[0] === "#") return String.fromCodePoint(e[1] === "x" || e[1] === "X" ? parseInt(e.slice(2), 16) : +e.slice(1));
+      return ENTITIES.hasOwnProperty(e) ? ENTITIES[e] : m;
+    }).replace(/\\s+/g, " ").trim();
+  }
+
+  // p = [lat, lon, name, url, insta?]
+  function popupHtml(style, p){
+    if(!style.centered) return link(p[3], p[2]);
+    var extra = p[4]
+      ? '<div style="margin-top:6px;"><a href="' + p[4] + '"' + LINK
+        + ' style="display:inline-flex; align-items:center; justify-content:center;">' + INSTAGRAM_SVG + '</a></div>'
+      : '';
+    return '<div style="text-align:center;font-size:13px;line-height:1.35;"><div>' + link(p[3], p[2]) + '</div>' + extra + '</div>';
+  }
+
+  // 見た目は runtime_css() の .seto-pt-<key>（マーカーごとに style を書かない）
+  function squareIcon(style){
+    var s = style.size, h = Math.floor(s / 2);
+    return L.divIcon({className: "seto-pt seto-pt-" + style.key, iconSize: [s, s], iconAnchor: [h, h],
+                      popupAnchor: [0, Math.floor(-s / 2)]});
+  }
+
+  // --canvas：四角を div ではなく共有 canvas に描く（地図は preferCanvas、CircleMarker と同じ描画経路）
+  var SquareMarker = L.CircleMarker.extend({
+    _updatePath: function(){ this._renderer._updateSquare(this); },
+    _containsPoint: function(p){
+      var r = this._radius + this._clickTolerance();
+      return Math.abs(p.x - this._point.x) <= r && Math.abs(p.y - this._point.y) <= r;
+    }
+  });
+  L.Canvas.include({
+    _updateSquare: function(layer){
+      if(!this._drawing || layer._empty()) return;
+      var p = layer._point, r = layer._radius, w = layer.options.stroke ? layer.options.weight / 2 : 0;
+      this._ctx.beginPath();
+      this._ctx.rect(p.x - r + w, p.y - r + w, 2 * (r - w), 2 * (r - w));
+      this._fillStroke(this._ctx, layer);
+    }
+  });
+
+  function squareMarker(style){
+    var opts = {radius: style.size / 2};
+    if(style.border) return L.extend(opts, {color: style.border, weight: 1.5, opacity: 1, fill: false});
+    return L.extend(opts, {stroke: false, fillColor: style.color, fillOpacity: style.opacity});
+  }
+
+  // 点1つ分のマーカー（style.canvas なら SquareMarker、それ以外は squareIcon の div）
+  function pointMarker(style){
+    var opts = style.canvas ? squareMarker(style) : {icon: squareIcon(style)};
+    return function(lat, lon){ return style.canvas ? new SquareMarker([lat, lon], opts) : L.marker([lat, lon], opts); };
+  }
+
+  // 共通：ラベルHTML（regions と islands を揃える）
+  function labelIcon(name){
+    return L.divIcon({className: "seto-label", iconSize: [240, 24], iconAnchor: [120, 12], html: name});
+  }
+
+  // ポップアップは初回クリック時に作る（検索からは group._setoOpen(mk)）
+  function lazyPopups(group, content, options){
+    group.on("click", function(e){
+      var mk = e.layer;
+      if(!mk._seto || mk.getPopup()) return;
+      mk.bindPopup(content(mk._seto, mk), options).openPopup();
+    });
+    group._setoOpen = function(mk){
+      if(!mk.getPopup()) mk.bindPopup(content(mk._seto, mk), options);
+      mk.openPopup();
+    };
+  }
+
+  // --nearby：ポップアップの下に、ほかのレイヤーの近い点（refs = [レイヤー番号, 行, m, ...]）
+  // 参照先が未読み込み（--lazy）なら読んでから name を入れる。クリックでその点へ
+  var layers = {};  // レイヤーkey → pointLayer / tileLayer の group
+
+  function distance(m){ return m < 1000 ? m + " m" : (m / 1000).toFixed(1) + " km"; }
+
+  function nearbyPopup(group, mk, html, keys, refs){
+    var box = L.DomUtil.create("div"), list;
+    box.innerHTML = html;
+    list = L.DomUtil.create("div", "seto-near", box);
+    for(var k = 0; k < refs.length; k += 3) (function(key, row, m){
+      var target = layers[key];
+      if(!target) return;
+      var item = L.DomUtil.create("div", "seto-near-item", list);
+      L.DomUtil.create("span", "seto-pt seto-pt-" + key, item);
+      var name = L.DomUtil.create("span", "seto-near-name", item);
+      L.DomUtil.create("span", "seto-near-dist", item).textContent = distance(m);
+      function fill(){ name.textContent = plainText(target._setoRow(row)._seto[2]); }
+      if(target._setoLoaded) fill();
+      else {
+        name.textContent = "…";
+        load(target).then(function(){ fill(); if(mk.getPopup()) mk.getPopup().update(); });
+      }
+      item.onclick = function(){ if(group._map) showRow(group._map, target, key, row, name.textContent); };
+    })(keys[refs[k]], refs[k + 1], refs[k + 2]);
+    return box;
+  }
+
+  // data が無いレイヤーは src を初回 load() 時に fetch する（結果はメモリに保持）
+  function deferred(group, data, src, build){
+    if(data){ build(data); group._setoLoaded = true; return group; }
+    var pending = null;
+    group._setoLoad = function(){
+      if(!pending){
+        pending = fetch(src).then(function(res){
+          if(!res.ok) throw new Error(src + ": " + res.status);
+          return res.json();
+        }).then(function(d){
+          build(d);
+          group._setoLoaded = true;
+          return group;
+        });
+        // 失敗したら次のトグルで再試行
+        pending.catch(function(){ pending = null; });
+      }
+      return pending;
+    };
+    return group;
+  }
+
+  function load(group){
+    if(!group || group._setoLoaded || !group._setoLoad) return Promise.resolve(group);
+    return group._setoLoad();
+  }
+
+  function clusterIcon(style, n){
+    var d = Math.min(style.size + 4 * Math.round(Math.log(n) / Math.LN2), 40), h = Math.floor(d / 2);
+    return L.divIcon({className: "seto-cluster seto-cluster-" + style.key, iconSize: [d, d], iconAnchor: [h, h],
+                      html: '<div style="line-height:' + d + 'px">' + n + '</div>'});
+  }
+
+  // data = {rows: [[lat, lon, name, url, insta?]...],
+  //         clusters?: {minZoom, maxZoom, levels: {z: [...]}}, index?: {block, pad, boxes: [s, w, n, e, ...]},
+  //         near?: [[レイヤー番号, 行, m, ...]...], nearLayers?: [レイヤーkey...]}
+  function pointLayer(group, style, data, src){
+    var make = pointMarker(style), near = null;
+    layers[style.key] = group;
+    lazyPopups(group, function(p, mk){
+      var html = popupHtml(style, p), refs = near && near.near[mk._setoI];
+      return refs && refs.length ? nearbyPopup(group, mk, html, near.nearLayers, refs) : html;
+    }, {maxWidth: style.popupWidth});
+    return deferred(group, data, src, function(d){
+      var rows = d.rows, markers = [];
+      if(d.near) near = d;
+      function marker(i){
+        if(!markers[i]){
+          markers[i] = make(rows[i][0], rows[i][1]);
+          markers[i]._seto = rows[i];
+          markers[i]._setoI = i;
+        }
+        return markers[i];
+      }
+      group._setoRow = marker;
+      if(d.clusters || d.index || style.densityZoom != null) return dynamic(group, style, d, marker);
+      for(var i = 0; i < rows.length; i++) group.addLayer(marker(i));
+    });
+  }
+
+  // 中身をズーム（clusters）と表示範囲（index）に合わせて入れ替える
+  // - clusters：ズームごとの集合はビルド時に計算済み、levels[z] の要素は 点の index か [lat, lon, 件数]
+  // - index：点は空間順に並んでいるので、表示範囲に重なるブロックの点だけ調べる
+  function dynamic(group, style, d, marker){
+    var rows = d.rows, cl = d.clusters, ix = d.index;
+    var cache = {}, shown = {}, map = null, lastZ = null;
+
+    function clusterLevel(z){
+      if(z < cl.minZoom) z = cl.minZoom;
+      var items = z <= cl.maxZoom ? cl.levels[z] : null;
+      if(!items) return null;  // 全点表示
+      if(cache[z]) return cache[z];
+      return cache[z] = items.map(function(it){
+        if(typeof it === "number") return marker(it);
+        var c = L.marker([it[0], it[1]], {icon: clusterIcon(style, it[2]), title: it[2] + "件"});
+        c.on("click", function(){ if(map) map.setView(c.getLatLng(), Math.min(z + 2, cl.maxZoom + 1)); });
+        return c;
+      });
+    }
+
+    function inView(b){
+      var s = b.getSouth(), w = b.getWest(), n = b.getNorth(), e = b.getEast(), out = [];
+      for(var k = 0, bx = ix.boxes; k < bx.length; k += 4){
+        if(bx[k] > n || bx[k + 2] < s || bx[k + 1] > e || bx[k + 3] < w) continue;
+        var first = (k / 4) * ix.block, last = Math.min(first + ix.block, rows.length);
+        for(var i = first; i < last; i++){
+          var p = rows[i];
+          if(p[0] >= s && p[0] <= n && p[1] >= w && p[1] <= e) out.push(marker(i));
+        }
+      }
+      return out;
+    }
+
+    function members(z){
+      if(z <= style.densityZoom) return [];  // --density：このズーム以下は densityLayer が描く
+      var level = cl ? clusterLevel(z) : null;
+      if(!ix){
+        if(level) return level;
+        if(!cache.all){ cache.all = []; for(var i = 0; i < rows.length; i++) cache.all.push(marker(i)); }
+        return cache.all;
+      }
+      var b = map.getBounds().pad(ix.pad);
+      if(!level) return inView(b);
+      return level.filter(function(l){ return b.contains(l.getLatLng()); });
+    }
+
+    function refresh(){
+      if(!map) return;
+      var z = Math.floor(map.getZoom());
+      if(!ix && z === lastZ) return;
+      lastZ = z;
+      var next = members(z), keep = {};
+      for(var i = 0; i < next.length; i++){
+        var id = L.stamp(next[i]);
+        keep[id] = next[i];
+        if(!shown[id]) group.addLayer(next[i]);
+      }
+      for(var id in shown) if(!keep[id]) group.removeLayer(shown[id]);
+      shown = keep;
+    }
+
+    // moveend はズーム変更の後にも来る
+    group.on("add", function(){ map = group._map; map.on("moveend", refresh); lastZ = null; refresh(); });
+    group.on("remove", function(){ if(map) map.off("moveend", refresh); map = null; });
+  }
+
+  // 静的タイル（--tiles）：表示範囲（+余白）のタイルだけ fetch し、読んだタイルはメモリに残す
+  // tiles = {url: ".../{z}/{x}/{y}.json", minZoom, maxZoom, bounds: [s, w, n, e]}
+  var TILE_PAD = 0.25, TILE_CACHE = 256, TILE_MAX_PER_VIEW = 64;
+
+  function tileLayer(group, style, tiles){
+    var make = pointMarker(style), cache = {}, order = [], shown = {}, map = null;
+    layers[style.key] = group;
+    var extent = tiles.bounds && L.latLngBounds([tiles.bounds[0], tiles.bounds[1]], [tiles.bounds[2], tiles.bounds[3]]);
+    lazyPopups(group, function(p){ return popupHtml(style, p); }, {maxWidth: style.popupWidth});
+
+    function tile(z, x, y){
+      var key = z + "/" + x + "/" + y;
+      if(cache[key]) return cache[key];
+      var t = cache[key] = {markers: null};
+      order.push(key);
+      var url = tiles.url.replace("{z}", z).replace("{x}", x).replace("{y}", y);
+      fetch(url).then(function(res){ return res.ok ? res.json() : {features: []}; }).then(function(fc){
+        t.markers = fc.features.map(function(f){
+          var c = f.geometry.coordinates, p = f.properties;
+          var mk = make(c[1], c[0]);
+          mk._seto = [c[1], c[0], p.name, p.url, p.insta];
+          return mk;
+        });
+        refresh();
+      }, function(){
+        // 失敗したら忘れて次に見えたときに読み直す（order にも残さない）
+        delete cache[key];
+        var i = order.indexOf(key);
+        if(i >= 0) order.splice(i, 1);
+      });
+      return t;
+    }
+
+    function visible(){
+      var zoom = Math.floor(map.getZoom()), out = [];
+      if(zoom < tiles.minZoom || zoom <= style.densityZoom) return out;
+      var z = Math.min(zoom, tiles.maxZoom), b = map.getBounds().pad(TILE_PAD);
+      if(extent){
+        if(!b.intersects(extent)) return out;
+        b = L.latLngBounds([Math.max(b.getSouth(), extent.getSouth()), Math.max(b.getWest(), extent.getWest())],
+                           [Math.min(b.getNorth(), extent.getNorth()), Math.min(b.getEast(), extent.getEast())]);
+      }
+      var nw = map.project(b.getNorthWest(), z).divideBy(256).floor();
+      var se = map.project(b.getSouthEast(), z).divideBy(256).floor();
+      if((se.x - nw.x + 1) * (se.y - nw.y + 1) > TILE_MAX_PER_VIEW) return out;
+      for(var x = nw.x; x <= se.x; x++)
+        for(var y = nw.y; y <= se.y; y++){
+          var t = tile(z, x, y);
+          if(t.markers) out.push.apply(out, t.markers);
+        }
+      return out;
+    }
+
+    function refresh(){
+      if(!map) return;
+      var next = visible(), keep = {};
+      for(var i = 0; i < next.length; i++){
+        var id = L.stamp(next[i]);
+        keep[id] = next[i];
+        if(!shown[id]) group.addLayer(next[i]);
+      }
+      for(var id in shown) if(!keep[id]) group.removeLayer(shown[id]);
+      shown = keep;
+      // 古いタイルから捨てる（表示中・読み込み中のものは飛ばして次を見る）
+      for(var k = 0; k < order.length && order.length > TILE_CACHE;){
+        var t = cache[order[k]];
+        if(t && (!t.markers || t.markers.some(function(mk){ return keep[L.stamp(mk)]; }))){ k++; continue; }
+        delete cache[order[k]];
+        order.splice(k, 1);
+      }
+    }
+
+    group.on("add", function(){ map = group._map; map.on("moveend", refresh); refresh(); });
+    group.on("remove", function(){ if(map) map.off("moveend", refresh); map = null; });
+    return group;
+  }
+
+  // 密度（--density）：z <= maxZoom の間、出ているレイヤーの件数を足した六角形を共有 canvas に描く
+  // data = density_levels() = {minZoom, maxZoom, radius, layers: [key...], levels: {z: [[lat, lon, 件数...]...]}}
+  // style = {colors: {key: 色}, labels: {key: 名前}}。色は件数のいちばん多いレイヤー、濃さは件数
+  function densityLayer(group, style, data){
+    var renderer = L.canvas({padding: 0.5}), cache = {}, shown = {}, map = null;
+
+    function cells(z){
+      if(cache[z]) return cache[z];
+      return cache[z] = (data.levels[z] || []).map(function(c){
+        var p = map.project([c[0], c[1]], z), ring = [];
+        for(var k = 0; k < 6; k++){
+          var a = Math.PI / 3 * k - Math.PI / 6;
+          ring.push(map.unproject([p.x + data.radius * Math.cos(a), p.y + data.radius * Math.sin(a)], z));
+        }
+        var hex = L.polygon(ring, {renderer: renderer, stroke: false});
+        hex._setoCounts = c.slice(2);
+        hex.on("click", function(){ map.setView([c[0], c[1]], data.maxZoom + 1); });
+        hex.bindTooltip(function(){
+          return data.layers.map(function(key, i){
+            return on[i] && hex._setoCounts[i] ? style.labels[key] + " " + hex._setoCounts[i] : null;
+          }).filter(Boolean).join("<br>");
+        });
+        return hex;
+      });
+    }
+
+    var on = [];
+    function refresh(){
+      if(!map) return;
+      var z = Math.floor(map.getZoom()), next = z <= data.maxZoom ? cells(Math.max(z, data.minZoom)) : [];
+      on = data.layers.map(function(key){ return !!layers[key] && map.hasLayer(layers[key]); });
+      var totals = next.map(function(hex){
+        for(var i = 0, n = 0; i < on.length; i++) if(on[i]) n += hex._setoCounts[i];
+        return n;
+      });
+      var max = Math.max.apply(null, totals.concat([1])), keep = {};
+      next.forEach(function(hex, j){
+        if(!totals[j]) return;
+        var top = 0;
+        for(var i = 1; i < on.length; i++) if(on[i] && (!on[top] || hex._setoCounts[i] > hex._setoCounts[top])) top = i;
+        hex.setStyle({fillColor: style.colors[data.layers[top]],
+                      fillOpacity: 0.15 + 0.55 * Math.sqrt(totals[j] / max)});
+        var id = L.stamp(hex);
+        keep[id] = hex;
+        if(!shown[id]) group.addLayer(hex);
+      });
+      for(var id in shown) if(!keep[id]) group.removeLayer(shown[id]);
+      shown = keep;
+    }
+    function toggled(e){ if(data.layers.some(function(key){ return layers[key] === e.layer; })) refresh(); }
+
+    group.on("add", function(){
+      map = group._map;
+      map.on("zoomend", refresh).on("layeradd layerremove", toggled);
+      refresh();
+    });
+    group.on("remove", function(){
+      if(map) map.off("zoomend", refresh).off("layeradd layerremove", toggled);
+      map = null;
+    });
+    return group;
+  }
+
+  // data = {islands: [[lat, lon, name]...], regions: [[lat, lon, name]...], zoomRules: island_zoom_rules()}
+  function areaLayer(group, style, data, src){
+    lazyPopups(group, function(p){ return p[2]; }, {maxWidth: 220});
+    return deferred(group, data, src, function(d){ buildArea(group, style, d); });
+  }
+
+  function buildArea(group, style, d){
+    var dots = [], labels = [], regions = [];
+    d.islands.forEach(function(p){
+      var dot = L.circleMarker([p[0], p[1]], {radius: 3, color: style.color, weight: 0, fill: true,
+                                              fillColor: style.color, fillOpacity: 0.3});
+      dot._seto = p;
+      dots.push(dot);
+      labels.push(L.marker([p[0], p[1]], {icon: labelIcon(p[2]), interactive: false, keyboard: false}));
+    });
+    // --declutter：地域のラベルも zoomRules で出し入れする（dot は無い）
+    d.regions.forEach(function(p){
+      var label = L.marker([p[0], p[1]], {icon: labelIcon(p[2]), interactive: false, keyboard: false});
+      regions.push(label);
+      if(d.zoomRules.declutter){ dots.push(null); labels.push(label); }
+      else group.addLayer(label);
+    });
+    islandRules(group, dots, labels, d.zoomRules);
+    // 検索の行番号：島 → 地域の順（--declutter では dots に地域の分の null も入るので島の数で分ける）
+    var n = d.islands.length;
+    group._setoRow = function(i){ return i < n ? dots[i] : regions[i - n]; };
+  }
+
+  // 島の dot / label / 非表示：ビルド時に計算した「しきい値をまたぐと状態が変わる島」だけ触る
+  // rules.changes[b] = しきい値 b をまたぐ島の [index, 下側の状態, 上側の状態, ...]
+  // 状態：0 = 非表示、1 = dot、2 = label（スマホはしきい値を mobileBoost だけ下げる）
+  function islandRules(group, dots, labels, rules){
+    var isMobile = window.matchMedia && window.matchMedia("(max-width: 600px)").matches;
+    var boost = isMobile ? rules.mobileBoost : 0, band = 0, map = null;
+
+    function put(l, on){ if(l && on !== group.hasLayer(l)) on ? group.addLayer(l) : group.removeLayer(l); }
+    function setState(i, s){ put(dots[i], s === 1); put(labels[i], s === 2); }
+    function bandOf(z){
+      var b = 0;
+      while(b < rules.thresholds.length && z >= rules.thresholds[b] - boost) b++;
+      return b;
+    }
+
+    function sync(){
+      var next = bandOf(map.getZoom()), target = {}, b, c, i;
+      if(next === band) return;
+      if(next > band){
+        for(b = band; b < next; b++)
+          for(c = rules.changes[b], i = 0; i < c.length; i += 3) target[c[i]] = c[i + 2];
+      } else {
+        for(b = band - 1; b >= next; b--)
+          for(c = rules.changes[b], i = 0; i < c.length; i += 3) target[c[i]] = c[i + 1];
+      }
+      for(i in target) setState(+i, target[i]);
+      band = next;
+    }
+
+    rules.initial.forEach(function(s, i){ setState(i, s); });
+    group.on("add", function(){ map = group._map; map.on("zoomend", sync); sync(); });
+    group.on("remove", function(){ if(map) map.off("zoomend", sync); map = null; });
+  }
+
+  // --search：search_index() の索引（bigram → entry の番号）で name を引く
+  var SEARCH_LIMIT = 20, SEARCH_VERIFY = 400, REVEAL_ZOOM = 15;
+
+  // search_key() と同じ正規化（NFKC・小文字・記号と空白を除く・カタカナ → ひらがな）
+  function searchKey(s){
+    return s.normalize("NFKC").toLowerCase().replace(/[^\\p{L}\\p{N}]+/gu, "")
+      .replace(/[\\u30a1-\\u30f6]/g, function(c){ return String.fromCharCode(c.charCodeAt(0) - 0x60); });
+  }
+
+  function searchIndex(d){
+    var posts = {}, keys = [], byChar = null;
+
+    function post(g){
+      if(posts[g]) return posts[g];
+      if(!d.grams[g]) return [];
+      var deltas = d.grams[g].split(","), ids = new Array(deltas.length);
+      for(var i = 0, id = 0; i < deltas.length; i++) ids[i] = id += +deltas[i];
+      return posts[g] = ids;
+    }
+    function key(id){
+      if(keys[id] === undefined) keys[id] = searchKey(d.names[id]) + (d.romaji ? "\\t" + d.romaji[id] : "");
+      return keys[id];
+    }
+    function intersect(a, b){
+      var out = [];
+      for(var i = 0, j = 0; i < a.length && j < b.length;){
+        if(a[i] < b[j]) i++; else if(a[i] > b[j]) j++; else { out.push(a[i]); i++; j++; }
+      }
+      return out;
+    }
+    // 1文字：その文字で始まる bigram の和（bigram の一覧は初回だけ作る）
+    function single(c){
+      if(!byChar){
+        byChar = {};
+        for(var g in d.grams) (byChar[g[0]] = byChar[g[0]] || []).push(g);
+      }
+      var seen = new Uint8Array(d.names.length), out = [];
+      (byChar[c] || []).forEach(function(g){
+        for(var ids = post(g), i = 0; i < ids.length; i++) seen[ids[i]] = 1;
+      });
+      for(var id = 0; id < seen.length; id++) if(seen[id]) out.push(id);
+      return out;
+    }
+    function candidates(q){
+      if(q.length === 1) return single(q);
+      var lists = [];
+      for(var i = 0; i + 1 < q.length; i++) lists.push(post(q.substr(i, 2)));
+      lists.sort(function(a, b){ return a.length - b.length; });
+      var ids = lists[0];
+      for(var k = 1; k < lists.length && ids.length; k++) ids = intersect(ids, lists[k]);
+      return ids;
+    }
+
+    // 前方一致 → 短い name の順に最大 limit 件（確かめるのは候補の先頭 SEARCH_VERIFY 件まで）
+    function query(text, limit){
+      var q = searchKey(text || "");
+      if(!q) return [];
+      var ids = candidates(q), hits = [];
+      for(var i = 0; i < ids.length && hits.length < SEARCH_VERIFY; i++){
+        var k = key(ids[i]), at = k.indexOf(q);
+        if(at >= 0) hits.push({id: ids[i], rank: (at === 0 || k.indexOf("\\t" + q) >= 0 ? 0 : 1e6) + d.names[ids[i]].length});
+      }
+      hits.sort(function(a, b){ return a.rank - b.rank || a.id - b.id; });
+      return hits.slice(0, limit || SEARCH_LIMIT).map(function(h){ return entry(h.id); });
+    }
+    function entry(id){
+      var l = d.starts.length - 1;
+      while(l > 0 && d.starts[l] > id) l--;
+      return {id: id, name: d.names[id], layer: d.layers[l], label: d.labels[l], row: id - d.starts[l]};
+    }
+    return {query: query, entry: entry};
+  }
+
+  // 行の位置へ飛んでポップアップを開く（点が地図に無ければ name だけのポップアップ）
+  function reveal(map, group, row, name){
+    var mk = group._setoRow && group._setoRow(row);
+    if(!mk) return;
+    map.once("moveend", function(){
+      if(mk._seto && group._setoOpen && group.hasLayer(mk)) group._setoOpen(mk);
+      else L.popup().setLatLng(mk.getLatLng()).setContent(name).openOn(map);
+    });
+    map.flyTo(mk.getLatLng(), Math.max(map.getZoom(), REVEAL_ZOOM));
+  }
+
+  // レイヤーが出ていなければトグルのボタンで出し、読み込んでから行の位置へ（検索と --nearby）
+  function showRow(map, group, key, row, name){
+    var btn = document.getElementById("btn-" + key);
+    if(btn && !map.hasLayer(group)) btn.onclick();
+    return load(group).then(function(){ if(map.hasLayer(group)) reveal(map, group, row, name); });
+  }
+
+  // toggle-box（#customToggle）に検索欄と結果を足す。groups = {レイヤーkey: FeatureGroup, area: ...}
+  // 選んだ entry のレイヤーが出ていなければトグルのボタンで出してから飛ぶ
+  function searchBox(map, groups, data, src){
+    var index = data ? searchIndex(data) : null, pending = null;
+    function ready(){
+      if(index) return Promise.resolve(index);
+      if(!pending){
+        pending = fetch(src).then(function(res){
+          if(!res.ok) throw new Error(src + ": " + res.status);
+          return res.json();
+        }).then(function(d){ return index = searchIndex(d); });
+        pending.catch(function(){ pending = null; });
+      }
+      return pending;
+    }
+
+    function select(e){
+      if(groups[e.layer]) showRow(map, groups[e.layer], e.layer, e.row, e.name);
+    }
+
+    function init(){
+      var box = document.getElementById("customToggle");
+      if(!box){ setTimeout(init, 50); return; }
+      var input = L.DomUtil.create("input", "seto-search"), list = L.DomUtil.create("div", "seto-results");
+      input.type = "search";
+      input.placeholder = "検索";
+      box.insertBefore(list, box.children[1] || null);
+      box.insertBefore(input, list);
+      var hits = [];
+
+      function render(){
+        list.innerHTML = "";
+        hits.forEach(function(e){
+          var item = L.DomUtil.create("div", "seto-result on-" + e.layer, list);
+          L.DomUtil.create("span", "sq", item);
+          L.DomUtil.create("span", "seto-result-name", item).textContent = e.name;
+          L.DomUtil.create("span", "seto-result-layer", item).textContent = e.label;
+          item.onclick = function(){ select(e); };
+        });
+      }
+      input.addEventListener("input", function(){
+        var text = input.value;
+        ready().then(function(ix){
+          if(input.value !== text) return;  // 読み込み中に打ち変えた
+          hits = ix.query(text);
+          render();
+        });
+      });
+      input.addEventListener("keydown", function(ev){
+        if(ev.key === "Enter" && hits.length) select(hits[0]);
+        if(ev.key === "Escape"){ input.value = ""; hits = []; render(); }
+      });
+    }
+    if(document.readyState === "loading") document.addEventListener("DOMContentLoaded", init); else init();
+  }
+
+  return {pointLayer: pointLayer, tileLayer: tileLayer, areaLayer: areaLayer, densityLayer: densityLayer, load: load,
+          searchIndex: searchIndex, searchBox: searchBox};
+})();
+"""
+
+def runtime_css(specs: list, nearby: bool = False) -> str:
+    """マーカー・ラベル・クラスタの見た目（レイヤーごとに1行、マーカーは class だけ持つ。nearby なら近くの一覧も）"""
+    rules = [
+        ".seto-label { font-size:9px; color:rgba(0,0,0,0.6); white-space:nowrap; text-align:center;"
+        " text-shadow:0 0 3px rgba(255,255,255,0.9); pointer-events:none; }",
+        ".seto-cluster div { width:100%; height:100%; border-radius:50%; text-align:center;"
+        " font-size:10px; color:#fff; font-family:system-ui, sans-serif; }",
+    ]
+    for spec in specs:
+        key = spec["key"]
+        if spec.get("border"):
+            rules.append(f'.seto-pt-{key} {{ box-sizing:border-box; border:1.5px solid {spec["border"]};'
+                         f' background:transparent; border-radius:1px; }}')
+        else:
+            rules.append(f'.seto-pt-{key} {{ background:{spec["color"]}; opacity:{spec["opacity"]}; }}')
+        rules.append(f'.seto-cluster-{key} div {{ background:{spec.get("border") or spec["color"]};'
+                     f' opacity:{max(spec["opacity"], 0.7)}; }}')
+    if nearby:
+        rules += [
+            ".seto-near { margin-top:6px; padding-top:4px; border-top:1px solid rgba(0,0,0,0.1); }",
+            ".seto-near-item { display:flex; align-items:center; gap:6px; padding:2px 0; cursor:pointer;"
+            " font-size:12px; color:rgba(0,0,0,0.78); }",
+            ".seto-near-item:hover { background:rgba(0,0,0,0.04); }",
+            ".seto-near .seto-pt { display:inline-block; flex:none; width:8px; height:8px; }",
+            ".seto-near-dist { margin-left:auto; font-size:10px; color:rgba(0,0,0,0.45); }",
+        ]
+    return "\n".join(rules)
+
+class SetoRuntime(MacroElement):
+    """pointLayer / tileLayer / areaLayer / load の共通JS と runtime_css()（地図に1回だけ）"""
+    _template = Template("""
+        {% macro header(this, kwargs) %}<style>{{ this.css }}</style>{% endmacro %}
+        {% macro script(this, kwargs) %}{{ this.code }}{% endmacro %}
+    """)
+
+    def __init__(self, specs: list, nearby: bool = False):
+        super().__init__()
+        self._name = "SetoRuntime"
+        self.css = runtime_css(specs, nearby)
+        self.code = RUNTIME_JS
+
+class PointLayer(folium.FeatureGroup):
+    """1レイヤー分の点を layer_payload() の JSON 1つとして書き出す FeatureGroup（src なら初回表示時に fetch）"""
+    _template = FoliumTemplate("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.featureGroup(
+                {{ this.options|tojavascript }}
+            );
+            SetoMap.pointLayer({{ this.get_name() }}, {{ this.style_js }}, {{ this.data_js }}, {{ this.src_js }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, spec: dict, data_js: str = "null", src: str = None, canvas: bool = False,
+                 density: int = None):
+        super().__init__(name=spec["name"], show=spec["show"])
+        self.style_js = to_js(layer_style(spec, canvas, density))
+        self.data_js = data_js
+        self.src_js = to_js(src)
+
+class PointTileLayer(folium.FeatureGroup):
+    """--tiles：点を埋め込まず、表示範囲の静的タイル（tile_source()）を読み込む FeatureGroup"""
+    _template = FoliumTemplate("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.featureGroup(
+                {{ this.options|tojavascript }}
+            );
+            SetoMap.tileLayer({{ this.get_name() }}, {{ this.style_js }}, {{ this.tiles_js }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, spec: dict, tiles: dict, canvas: bool = False, density: int = None):
+        super().__init__(name=spec["name"], show=spec["show"])
+        self.style_js = to_js(layer_style(spec, canvas, density))
+        self.tiles_js = to_js(tiles)
+
+class DensityLayer(folium.FeatureGroup):
+    """--density：density_levels() の六角形を、出ているレイヤーの件数で描く（トグルには出さない）"""
+    _template = FoliumTemplate("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.featureGroup(
+                {{ this.options|tojavascript }}
+            );
+            SetoMap.densityLayer({{ this.get_name() }}, {{ this.style_js }}, {{ this.data_js }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, specs: list, data_js: str = "null"):
+        super().__init__(name=DENSITY_NAME, control=False)
+        self.style_js = to_js({
+            "colors": {spec["key"]: spec.get("border") or spec["color"] for spec in specs},
+            "labels": {spec["key"]: spec["name"] for spec in specs},
+        })
+        self.data_js = data_js
+
+class AreaLayer(folium.FeatureGroup):
+    """地域・島：島の dot / label と地域ラベルをクライアント側で作る"""
+    _template = FoliumTemplate("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.featureGroup(
+                {{ this.options|tojavascript }}
+            );
+            SetoMap.areaLayer({{ this.get_name() }}, {{ this.style_js }}, {{ this.data_js }}, {{ this.src_js }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, name: str, color: str, data_js: str = "null", src: str = None):
+        super().__init__(name=name, show=False)
+        self.style_js = to_js({"color": color})
+        self.data_js = data_js
+        self.src_js = to_js(src)
+
+class SearchBox(MacroElement):
+    """--search：toggle-box に検索欄を足し、search_index() の索引で name を引く（src なら初回入力時に fetch）"""
+    _template = Template("""
+        {% macro header(this, kwargs) %}<style>
+        .seto-search { width:100%; box-sizing:border-box; margin:0 0 6px; padding:6px 8px; font-size:13px;
+          border:1px solid rgba(0,0,0,0.15); border-radius:8px; }
+        .seto-results { max-height:240px; overflow-y:auto; }
+        .seto-result { display:flex; align-items:center; gap:8px; padding:6px 8px; border-radius:8px; cursor:pointer;
+          font-size:12px; color:rgba(0,0,0,0.78); }
+        .seto-result:hover { background:rgba(0,0,0,0.04); }
+        .seto-result-layer { margin-left:auto; font-size:10px; color:rgba(0,0,0,0.45); }
+        @media (max-width:600px) { .seto-search, .seto-result { font-size:11px; padding:4px 6px; } }
+        </style>{% endmacro %}
+        {% macro script(this, kwargs) %}
+            SetoMap.searchBox({{ this.map_var }}, {{ this.groups_js }}, {{ this.data_js }}, {{ this.src_js }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, m: folium.Map, layers: dict, layer_area: folium.FeatureGroup,
+                 data_js: str = "null", src: str = None):
+        super().__init__()
+        self._name = "SearchBox"
+        self.map_var = m.get_name()
+        self.groups_js = "{" + ", ".join(
+            [f'"{key}": {layer.get_name()}' for key, layer in layers.items()] + [f'"area": {layer_area.get_name()}']
+        ) + "}"
+        self.data_js = data_js
+        self.src_js = to_js(src)
+
+# =====================
+# 島の表示ルール（ズームしきい値ごとの状態変化を事前計算）
+# - z >= NAME_ZOOM       : label
+# - min_zoom 指定島      : z < min_zoom なら非表示、以上なら label
+# - それ以外             : dot
+# しきい値（NAME_ZOOM と NAME_ZOOM 未満の min_zoom）で区切った帯ごとに状態を決め、
+# 隣の帯と状態が違う島だけを changes に残す。スマホの -MOBILE_ZOOM_BOOST は
+# 全しきい値が同じだけずれるだけなので、クライアント側でしきい値から引く
+# =====================
+ISLAND_HIDDEN, ISLAND_DOT, ISLAND_LABEL = 0, 1, 2
+
+def island_zoom_rules(min_zoom: pd.Series, name_zoom: float = NAME_ZOOM) -> dict:
+    mz = min_zoom.to_numpy(dtype=float, na_value=np.nan)
+    thresholds = sorted({float(name_zoom)} | {float(v) for v in np.unique(mz[~np.isnan(mz)]) if v < name_zoom})
+
+    # 帯 b の代表ズーム：b=0 は -inf、b>=1 は thresholds[b-1]
+    z = np.array([-np.inf] + thresholds)[None, :]
+    m = mz[:, None]
+    state = np.where(z >= name_zoom, ISLAND_LABEL,
+                     np.where(np.isnan(m), ISLAND_DOT,
+                              np.where(z < m, ISLAND_HIDDEN, ISLAND_LABEL)))
+
+    return zoom_rules(state, thresholds)
+
+def zoom_rules(state: np.ndarray, thresholds: list, mobile_boost: float = MOBILE_ZOOM_BOOST) -> dict:
+    """state[i, b] = 帯 b（b>=1 は thresholds[b-1] 以上）での i の状態 → 隣の帯と違うものだけの changes"""
+    changes = []
+    for b in range(1, state.shape[1]):
+        idx = np.flatnonzero(state[:, b] != state[:, b - 1])
+        changes.append(np.column_stack([idx, state[idx, b - 1], state[idx, b]]).ravel().tolist())
+
+    return {
+        "thresholds": [int(t) if float(t).is_integer() else t for t in thresholds],
+        "mobileBoost": mobile_boost,
+        "initial": state[:, 0].tolist(),
+        "changes": changes,
+    }
+
+# =====================
+# ラベルの間引き（--declutter）
+# - DECLUTTER_ZOOMS の整数ズームごとに、ラベルの箱（ピクセル）を優先度順に置き、
+#   置いた箱と重なるものは出さない（LABEL_CELL px のグリッドで当たり判定）
+# - 優先度：地域（CSV の順）→ 島（area 列があれば大きい順、次に min_zoom 無し → 小さい順、同じなら CSV の順）
+# - 置けなかった島は dot、min_zoom より手前（かつ name_zoom 未満）の島は今まで通り非表示
+# - 結果は zoom_rules() の形で、地域も島と同じ仕組みで出し入れする（labels = 島 + 地域）
+#   ピクセルで判定しているのでスマホのしきい値ずらし（mobileBoost）はしない
+# =====================
+DECLUTTER_ZOOMS = (6, 16)  # 6 未満はラベル無し（島は dot）、16 以上は 16 の配置
+LABEL_FONT_PX = 9          # labelIcon の font-size
+LABEL_HEIGHT = 12
+LABEL_PAD = 4
+LABEL_CELL = 64
+
+def label_width(name: str) -> float:
+    # 全角は font-size 分、半角はその 0.6 倍くらい
+    return sum(LABEL_FONT_PX if ord(c) >= 0x2E80 else LABEL_FONT_PX * 0.6 for c in name) + LABEL_PAD
+
+def place_labels(x: np.ndarray, y: np.ndarray, widths: np.ndarray, order: list) -> np.ndarray:
+    """中心 (x, y) px・幅 widths のラベルを order の順に置き、置けたものを True にして返す"""
+    grid = {}
+    placed = np.zeros(len(x), dtype=bool)
+    h = (LABEL_HEIGHT + LABEL_PAD) / 2
+    for i in order:
+        box = (x[i] - widths[i] / 2, y[i] - h, x[i] + widths[i] / 2, y[i] + h)
+        cells = [(cx, cy)
+                 for cx in range(int(box[0] // LABEL_CELL), int(box[2] // LABEL_CELL) + 1)
+                 for cy in range(int(box[1] // LABEL_CELL), int(box[3] // LABEL_CELL) + 1)]
+        if any(b[0] < box[2] and box[0] < b[2] and b[1] < box[3] and box[1] < b[3]
+               for c in cells for b in grid.get(c, ())):
+            continue
+        for c in cells:
+            grid.setdefault(c, []).append(box)
+        placed[i] = True
+    return placed
+
+def declutter_rules(islands: pd.DataFrame, regions: pd.DataFrame, name_zoom: float = NAME_ZOOM) -> dict:
+    n_i, n_r = len(islands), len(regions)
+    mz = min_zoom_column(islands).to_numpy(dtype=float, na_value=np.nan)
+    names = text_column(islands, "name").tolist() + text_column(regions, "name").tolist()
+    x, y = mercator_xy(np.concatenate([islands["lat"].to_numpy(float), regions["lat"].to_numpy(float)]),
+                       np.concatenate([islands["lon"].to_numpy(float), regions["lon"].to_numpy(float)]))
+    widths = np.array([label_width(name) for name in names])
+
+    area = (pd.to_numeric(islands["area"], errors="coerce").fillna(0).to_numpy()
+            if "area" in islands.columns else np.zeros(n_i))
+    island_order = np.lexsort((np.arange(n_i), np.nan_to_num(mz), ~np.isnan(mz), -area))
+    region_order = list(range(n_i, n_i + n_r))
+
+    zooms = range(DECLUTTER_ZOOMS[0], DECLUTTER_ZOOMS[1] + 1)
+    state = np.zeros((n_i + n_r, len(zooms) + 1), dtype=np.int64)
+    state[:n_i, 0] = ISLAND_DOT  # 帯 0（DECLUTTER_ZOOMS より手前）
+    for b, z in enumerate(zooms, start=1):
+        hidden = ~np.isnan(mz) & (z < mz) & (z < name_zoom)
+        order = region_order + [int(i) for i in island_order if not hidden[i]]
+        placed = place_labels(x * 256 * 2 ** z, y * 256 * 2 ** z, widths, order)
+        state[:n_i, b] = np.where(hidden, ISLAND_HIDDEN, np.where(placed[:n_i], ISLAND_LABEL, ISLAND_DOT))
+        state[n_i:, b] = np.where(placed[n_i:], ISLAND_LABEL, ISLAND_HIDDEN)
+
+    rules = zoom_rules(state, list(zooms), mobile_boost=0)
+    rules["declutter"] = True
+    return rules
+
+def area_payload(islands: pd.DataFrame, regions: pd.DataFrame, name_zoom: float = NAME_ZOOM,
+                 declutter: bool = False) -> dict:
+    return {
+        "islands": layer_rows(pd.DataFrame({
+            "lat": islands["lat"], "lon": islands["lon"], "name": text_column(islands, "name"),
+        })),
+        "regions": layer_rows(pd.DataFrame({
+            "lat": regions["lat"], "lon": regions["lon"], "name": text_column(regions, "name"),
+        })),
+        "zoomRules": (declutter_rules(islands, regions, name_zoom) if declutter
+                      else island_zoom_rules(min_zoom_column(islands), name_zoom)),
+    }
+
+# =====================
+# 検索索引（--search）
+# - 全レイヤー（--tiles のレイヤーを除く）と島・地域の name を entry にし、bigram → entry の転置索引を作る
+# - 比較用の文字列は name_key() + カタカナ → ひらがな（pykakasi があればローマ字読みも同じ索引に入れる）
+# - 末尾に " " を足して bigram を取るので、どの文字にもそれで始まる bigram がある（1文字の検索用）
+# - entry は sources の順に通し番号、レイヤーの境目は starts。grams の番号は差分を "," でつないだ文字列
+# - クライアントは検索語の bigram の番号を突き合わせ（少ない順）、残った entry だけ文字列を確かめる
+# =====================
+KATA_TO_HIRA = str.maketrans({chr(c): chr(c - 0x60) for c in range(0x30A1, 0x30F7)})
+
+def search_key(name: pd.Series) -> pd.Series:
+    return name_key(name).str.translate(KATA_TO_HIRA)
+
+def romaji_key(name: pd.Series) -> pd.Series:
+    kks = pykakasi.kakasi()
+    romaji = ["".join(t["hepburn"] for t in kks.convert(n)) for n in name.tolist()]
+    return name_key(pd.Series(romaji, index=name.index, dtype=object))
+
+def search_index(sources: list) -> dict:
+    """sources = [(レイヤーkey, UI の名前, name のリスト（payload の行の順）), ...]
+    name は plain_text() にしてから索引・表示に使う（行の順は変えない）"""
+    names, starts = [], []
+    for _, _, ns in sources:
+        starts.append(len(names))
+        names += ns
+    s = plain_text(pd.Series(names, dtype=object))
+    names = s.tolist()
+    keys = [search_key(s).tolist()]
+    if pykakasi:
+        keys.append(romaji_key(s).tolist())
+
+    grams = {}
+    for col in keys:
+        for i, k in enumerate(col):
+            k += " "
+            for g in {k[j:j + 2] for j in range(len(k) - 1)}:
+                grams.setdefault(g, []).append(i)
+    index = {
+        "layers": [key for key, _, _ in sources],
+        "labels": [label for _, label, _ in sources],
+        "starts": starts,
+        "names": names,
+        "grams": {g: ",".join(map(str, np.diff(np.unique(ids), prepend=0).tolist())) for g, ids in sorted(grams.items())},
+    }
+    if pykakasi:
+        index["romaji"] = keys[1]
+    return index
+
+def search_payload(specs: list, names: dict, area: dict) -> dict:
+    """names = {レイヤーkey: payload の行の name}、area = area_payload() → search_index()"""
+    sources = [(spec["key"], spec["name"], names[spec["key"]]) for spec in specs]
+    sources.append(("area", AREA_NAME, [r[2] for r in area["islands"] + area["regions"]]))
+    return search_index(sources)
+
+def read_fragment(path: str):
+    """ensure_fragment() のファイルの payload を読む"""
+    with open(path, encoding="utf-8") as f:
+        f.readline()
+        return json.load(f)
+
+def write_data_file(key: str, fragment: str, output: str = OUTPUT_HTML) -> str:
+    """--lazy 用：キャッシュの payload（fragment のパス）を <output>-data/<key>.json に写し（中身が同じなら触らない）、
+    HTML（output）からの相対URLを返す"""
+    out_dir = os.path.join(os.path.dirname(os.path.abspath(output)), side_dir(output, "data"))
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"{key}.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as out:
+        copy_fragment(fragment, out)
+    if os.path.exists(path) and filecmp.cmp(path, path + ".tmp", shallow=False):
+        os.remove(path + ".tmp")
+    else:
+        os.replace(path + ".tmp", path)
+    return f"{side_dir(output, 'data')}/{key}.json"
+
+def read_text(path: str) -> str:
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+# =====================
+# 出力（minify / 事前圧縮）
+# - minify：行頭・行末の空白、空行、<script> 内の行コメントを落とす（改行は残すので ASI は変わらない）
+# - --precompress：OUTPUT_HTML（と --lazy のデータ）の隣に .gz（brotli があれば .br も）を書く
+#   付けずにビルドしたら前に書いた .gz / .br は消す（古いページが配信されないように）
+# =====================
+def minify_html(html: str) -> str:
+    out = []
+    in_script = False
+    for line in html.splitlines():
+        line = line.strip()
+        if "<script" in line:
+            in_script = True
+        if "</script>" in line:
+            in_script = False
+        if not line or (in_script and line.startswith("//")):
+            continue
+        out.append(line)
+    return "\n".join(out) + "\n"
+
+COPY_CHUNK = 1 << 20  # ファイルを流すときの1回分（文字 / バイト）
+
+def precompress(path: str) -> list:
+    """path.gz / path.br を書き（元ファイルより新しければそのまま）、そのパスを返す。少しずつ圧縮するのでメモリは一定"""
+    out = path + ".gz"
+    if not (os.path.exists(out) and os.path.getmtime(out) >= os.path.getmtime(path)):
+        with open(path, "rb") as src, open(out, "wb") as raw, \
+                gzip.GzipFile(filename="", mode="wb", compresslevel=9, fileobj=raw, mtime=0) as dst:
+            shutil.copyfileobj(src, dst, COPY_CHUNK)
+    out = path + ".br"
+    if brotli is None:
+        remove_compressed(path, [".br"])  # 前に brotli で書いたものは古い
+    elif not (os.path.exists(out) and os.path.getmtime(out) >= os.path.getmtime(path)):
+        compressor = brotli.Compressor(quality=11)
+        with open(path, "rb") as src, open(out, "wb") as dst:
+            for chunk in iter(lambda: src.read(COPY_CHUNK), b""):
+                dst.write(compressor.process(chunk))
+            dst.write(compressor.finish())
+    return [path + ".gz"] + ([out] if brotli is not None else [])
+
+def remove_compressed(path: str, exts: list = (".gz", ".br")) -> None:
+    """--precompress 無しのビルドで、前に書いた path.gz / path.br（古い中身のまま配信される）を消す"""
+    for ext in exts:
+        if os.path.exists(path + ext):
+            os.remove(path + ext)
+
+# =====================
+# ストリーミング出力
+# - folium のツリーはレイヤーのデータを DATA_MARK にしたまま render する（骨組みだけなので小さい）
+# - 骨組みを DATA_MARK で区切り、間にキャッシュの payload ファイルを少しずつ流し込んで書く
+#   → HTML 全体も payload 全体もメモリに載せない（出力は埋め込んだ場合と同じ）
+# =====================
+DATA_MARK = "@@SETO_DATA:{}@@"
+DATA_MARK_RE = re.compile(r"@@SETO_DATA:([\w-]+)@@")
+
+def write_html(path: str, skeleton: str, fragments: dict) -> int:
+    """skeleton の DATA_MARK を fragments（名前 → payload ファイル）の中身にして path に書く。書いた文字数を返す"""
+    parts = DATA_MARK_RE.split(skeleton)
+    size = 0
+    with open(path + ".tmp", "w", encoding="utf-8") as out:
+        for i, part in enumerate(parts):
+            size += copy_fragment(fragments[part], out) if i % 2 else out.write(part)
+    os.replace(path + ".tmp", path)  # 書きかけの HTML を配信しない
+    return size
+
+# =====================
+# オフライン用の資産（--assets inline / files）
+# - この地図が使う外部ライブラリは Leaflet だけ（jQuery・Bootstrap・awesome-markers・Font Awesome は
+#   folium の既定で読まれるが、UI も runtime も触らない）ので Leaflet 以外は外す
+# - Leaflet はリポジトリに入れてある VENDOR_DIR のコピー（BSD-2、folium の既定と同じ版）を使う
+#   folium を上げて Leaflet の版が変わったときだけ、ネットにつながる所で --fetch-vendor を1回
+#   inline：HTML に埋め込む / files：<output>-assets/ に中身のハッシュ入りの名前で書く（長期キャッシュしてよい）
+# - leaflet.css の画像は data: URI にして CSS に入れる
+# - 背景地図（CARTO）のタイルは対象外（つながらなければ背景なしで点・島だけ出る）
+# =====================
+VENDOR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vendor")  # このファイルの隣
+LEAFLET_JS = dict(folium.Map.default_js)["leaflet"]
+LEAFLET_CSS = dict(folium.Map.default_css)["leaflet_css"]
+LEAFLET_IMAGES = ["layers.png", "layers-2x.png", "marker-icon.png", "marker-icon-2x.png", "marker-shadow.png"]
+
+def vendor_path(url: str) -> str:
+    """CDN の URL → 手元のパス（.../npm/leaflet@1.9.3/dist/leaflet.js → vendor/leaflet@1.9.3/dist/leaflet.js）"""
+    return os.path.join(VENDOR_DIR, *url.split("/npm/", 1)[1].split("/"))
+
+def vendor_urls() -> list:
+    base = LEAFLET_CSS.rsplit("/", 1)[0]
+    return [LEAFLET_JS, LEAFLET_CSS] + [f"{base}/images/{name}" for name in LEAFLET_IMAGES]
+
+def fetch_vendor() -> None:
+    """--fetch-vendor：vendor_urls() のうち手元に無いもの（Leaflet の版が変わった分）を取ってくる"""
+    for url in vendor_urls():
+        path = vendor_path(url)
+        if os.path.exists(path):
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with urllib.request.urlopen(url) as res, open(path + ".tmp", "wb") as f:
+            shutil.copyfileobj(res, f)
+        os.replace(path + ".tmp", path)
+        print("  fetched:", path)
+
+def vendor_text(url: str) -> str:
+    path = vendor_path(url)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} がありません（folium の Leaflet の版が vendor/ と違う。"
+                                "ネットにつながる所で --fetch-vendor を1回実行して取り込む）")
+    return read_text(path)
+
+def leaflet_css() -> str:
+    css_dir = os.path.dirname(vendor_path(LEAFLET_CSS))
+    def data_uri(match):
+        path = os.path.join(css_dir, *match.group(1).split("/"))
+        if not os.path.exists(path):
+            return match.group(0)
+        with open(path, "rb") as f:
+            return "url(data:image/png;base64," + base64.b64encode(f.read()).decode("ascii") + ")"
+    return re.sub(r"url\((images/[\w.-]+\.png)\)", data_uri, vendor_text(LEAFLET_CSS))
+
+def write_asset(name: str, ext: str, text: str, output: str = OUTPUT_HTML) -> str:
+    """<output>-assets/<name>.<ハッシュ><ext> を書き（同じ name の古いものは消す）、HTML からの相対URLを返す"""
+    out_dir = os.path.join(os.path.dirname(os.path.abspath(output)), side_dir(output, "assets"))
+    os.makedirs(out_dir, exist_ok=True)
+    data = text.encode("utf-8")
+    file_name = f"{name}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+    stale = re.compile(re.escape(name) + r"\.[0-9a-f]{12}" + re.escape(ext) + r"(\.gz|\.br)?")
+    for old in os.listdir(out_dir):
+        if stale.fullmatch(old) and not old.startswith(file_name):
+            os.remove(os.path.join(out_dir, old))
+    path = os.path.join(out_dir, file_name)
+    if not os.path.exists(path):
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+    return f"{side_dir(output, 'assets')}/{file_name}"
+
+class InlineAssets(MacroElement):
+    """--assets inline：Leaflet の CSS / JS を <head> にそのまま書く"""
+    _template = Template("""
+        {% macro header(this, kwargs) %}<style>{{ this.css }}</style>
+<script>{{ this.js }}</script>{% endmacro %}
+    """)
+
+    def __init__(self, css: str, js: str):
+        super().__init__()
+        self._name = "InlineAssets"
+        self.css = css.replace("</style", "<\\/style")
+        self.js = js.replace("</script", "<\\/script")
+
+def use_assets(m: folium.Map, mode: str, output: str = OUTPUT_HTML) -> list:
+    """m の外部 JS / CSS を Leaflet だけにして手元のコピーを使う。files で書いたファイルの相対URLを返す"""
+    css, js = leaflet_css(), vendor_text(LEAFLET_JS)
+    if mode == "inline":
+        m.default_js, m.default_css = [], []
+        InlineAssets(css, js).add_to(m)
+        return []
+    urls = [write_asset("leaflet", ".css", css, output), write_asset("leaflet", ".js", js, output)]
+    m.default_css, m.default_js = [("leaflet_css", urls[0])], [("leaflet", urls[1])]
+    return urls
+
+# =====================
+# 静的タイル（--tiles）
+# - CSV を TILE_CHUNK_ROWS 行ずつ読み、点を z/x/y の GeoJSON に振り分ける（メモリは chunk 1つ分）
+# - chunk ごとに <y>.part（1行 = 1 Feature）へ追記し、最後に 1タイルずつ FeatureCollection にする
+# - クライアントは表示範囲のタイルだけ fetch する（ネット接続・サーバー処理は不要）
+# =====================
+# 置き場は出力HTMLの隣の side_dir(output, "tiles")
+TILE_ZOOMS = (10, 14)         # この範囲のズームでタイルを作る（上は max のタイルを拡大して使う）
+TILE_CHUNK_ROWS = 50_000
+
+def feature_lines(pts: pd.DataFrame) -> pd.Series:
+    """1点 = 1行の GeoJSON Feature（列単位で文字列を組み立てる）"""
+    props = '"name":' + pts["name"].map(to_js) + ',"url":' + pts["url"].map(to_js)
+    if "insta" in pts.columns:
+        props = props + ',"insta":' + pts["insta"].map(to_js)
+    return (
+        '{"type":"Feature","geometry":{"type":"Point","coordinates":['
+        + pts["lon"].round(COORD_DIGITS).astype(str) + "," + pts["lat"].round(COORD_DIGITS).astype(str)
+        + ']},"properties":{' + props + "}}"
+    )
+
+def append_tile_parts(layer_dir: str, pts: pd.DataFrame, zooms: range) -> None:
+    lines = feature_lines(pts).to_numpy()
+    x, y = mercator_xy(pts["lat"].to_numpy(), pts["lon"].to_numpy())
+    for z in zooms:
+        n = 2 ** z
+        tx = np.clip(np.floor(x * n).astype(np.int64), 0, n - 1)
+        ty = np.clip(np.floor(y * n).astype(np.int64), 0, n - 1)
+        keys = tx * n + ty
+        order = np.argsort(keys, kind="stable")
+        uniq, starts = np.unique(keys[order], return_index=True)
+        for key, idx in zip(uniq.tolist(), np.split(order, starts[1:])):
+            tile_dir = os.path.join(layer_dir, str(z), str(key // n))
+            os.makedirs(tile_dir, exist_ok=True)
+            with open(os.path.join(tile_dir, f"{key % n}.part"), "a", encoding="utf-8") as f:
+                f.write("\n".join(lines[idx]) + "\n")
+
+def finalize_tiles(layer_dir: str) -> int:
+    """<y>.part を <y>.json（FeatureCollection）に 1行ずつ書き換える。タイル数を返す"""
+    count = 0
+    for root, _, files in os.walk(layer_dir):
+        for name in files:
+            if not name.endswith(".part"):
+                continue
+            part = os.path.join(root, name)
+            with open(part, encoding="utf-8") as src, \
+                    open(part[:-len(".part")] + ".json", "w", encoding="utf-8") as dst:
+                dst.write('{"type":"FeatureCollection","features":[')
+                for i, line in enumerate(src):
+                    dst.write(("," if i else "") + line.rstrip("\n"))
+                dst.write("]}")
+            os.remove(part)
+            count += 1
+    return count
+
+def export_tiles(path: str, specs: list, zooms: range, output: str = OUTPUT_HTML, bbox: list = None,
+                 dupes: dict = None, merge: bool = False) -> dict:
+    """1つの CSV を使うレイヤー（specs）のタイルを作り、レイヤーごとの範囲 [s, w, n, e] を返す
+    dupes（find_duplicates の結果）があれば重複を落とす"""
+    base = os.path.join(os.path.dirname(os.path.abspath(output)), side_dir(output, "tiles"))
+    bounds = {}
+    for spec in specs:
+        shutil.rmtree(os.path.join(base, spec["key"]), ignore_errors=True)
+
+    # 数値列は chunk ごとに型が変わらないよう normalize_latlon に任せる
+    cols = [c for c in pd.read_csv(path, nrows=0).columns if c in CSV_COLUMNS]
+    text = {c: str for c in cols if CSV_COLUMNS[c] is str}
+    offset = 0  # 行番号は load_frame の表と同じ（lat/lon が有効な行の通し番号）
+    for chunk in pd.read_csv(path, usecols=cols, dtype=text, chunksize=TILE_CHUNK_ROWS):
+        chunk = normalize_latlon(chunk).reset_index(drop=True)
+        chunk.index += offset
+        offset += len(chunk)
+        for spec in specs:
+            pts = drop_duplicates(clip_bbox(layer_points(spec, chunk), bbox), spec["key"], dupes, merge)
+            if pts.empty:
+                continue
+            b = [pts["lat"].min(), pts["lon"].min(), pts["lat"].max(), pts["lon"].max()]
+            old = bounds.get(spec["key"], b)
+            bounds[spec["key"]] = [min(b[0], old[0]), min(b[1], old[1]), max(b[2], old[2]), max(b[3], old[3])]
+            append_tile_parts(os.path.join(base, spec["key"]), pts, zooms)
+
+    for spec in specs:
+        n = finalize_tiles(os.path.join(base, spec["key"]))
+        print(f"  tiles: {spec['key']} ({n})")
+    return {k: [round(float(v), COORD_DIGITS) for v in b] for k, b in bounds.items()}
+
+def tile_stamp(key: str, output: str = OUTPUT_HTML) -> str:
+    """レイヤーのタイルの置き場に書く、書き出したときのキャッシュのキー"""
+    return os.path.join(os.path.dirname(os.path.abspath(output)), side_dir(output, "tiles"), key, "tiles.key")
+
+def tile_source(key: str, zooms: range, bounds: list, output: str = OUTPUT_HTML) -> dict:
+    return {"url": f"{side_dir(output, 'tiles')}/{key}/{{z}}/{{x}}/{{y}}.json",
+            "minZoom": zooms.start, "maxZoom": zooms.stop - 1, "bounds": bounds}
+
+# =====================
+# ビルドキャッシュ（--watch でも使う）
+# - レイヤーごとの payload（JSON文字列）を「CSVの中身 + スタイル + オプション + このスクリプト」の
+#   ハッシュをキーに CACHE_DIR に保存し、変わったレイヤーだけ作り直す
+# - 全体のキーが前回と同じなら OUTPUT_HTML には触らない
+# =====================
+CACHE_DIR = ".seto-cache"
+
+def file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+@functools.lru_cache(maxsize=None)
+def code_hash() -> str:
+    """このスクリプトのハッシュ（初めてキャッシュキーを作るときに読む。import では読まない）"""
+    return file_hash(__file__)
+
+def cache_key(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def fragment_is_fresh(name: str, key: str) -> bool:
+    """cached_fragment(name, key) が作り直さずに済むか（1行目のキーだけ読む）"""
+    path = os.path.join(CACHE_DIR, f"{name}.json")
+    if not os.path.exists(path):
+        return False
+    with open(path, encoding="utf-8") as f:
+        return f.readline().rstrip("\n") == key
+
+def ensure_fragment(name: str, key: str, make, force: bool = False) -> str:
+    """CACHE_DIR/<name>.json（1行目がキー）が key と違えば（force なら必ず）make() の payload を書き直し、パスを返す"""
+    path = os.path.join(CACHE_DIR, f"{name}.json")
+    if force or not fragment_is_fresh(name, key):
+        payload = make()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 書きかけ（中断・書き込み失敗）のファイルがキーだけ正しいまま残らないよう、書き終えてから置き換える
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(key + "\n")
+            write_js(f, payload)
+        os.replace(path + ".tmp", path)
+        print("  rebuilt:", name)
+    return path
+
+def copy_fragment(path: str, out) -> int:
+    """ensure_fragment() のファイルの payload（キーの行を除く）を out に流す。文字数を返す"""
+    size = 0
+    with open(path, encoding="utf-8") as f:
+        f.readline()
+        for chunk in iter(lambda: f.read(COPY_CHUNK), ""):
+            size += out.write(chunk)
+    return size
+
+def cached_fragment(name: str, key: str, make, force: bool = False) -> str:
+    """ensure_fragment() の payload を文字列で返す（小さいもの用）"""
+    with open(ensure_fragment(name, key, make, force), encoding="utf-8") as f:
+        f.readline()
+        return f.read()
+
+def csv_paths(specs: list = LAYERS) -> list:
+    return list(dict.fromkeys([spec["csv"] for spec in specs] + [ISLANDS_CSV, REGIONS_CSV]))
+
+# =====================
+# CSV読み込み（型指定・並列・サイドカー）
+# - 使う列（CSV_COLUMNS = 固定の列 + LAYERS の link 列・instagram_url）だけを型指定で読む。
+#   数値列に変換できない値があれば str で読み直し、
+#   normalize_latlon の to_numeric に任せる
+# - 複数の CSV はスレッドで並列に読む（--csv-engine pyarrow なら pyarrow のパーサー）
+# - normalize_latlon 済みの表を CACHE_DIR/frames/ に置き、CSV の mtime・サイズが同じ間は再利用
+#   （pyarrow があれば Feather、無ければ pickle）
+# =====================
+BASE_COLUMNS = {
+    "name": str, "url": str,
+    "lat": "float64", "lon": "float64", "min_zoom": "float64", "area": "float64",
+}
+
+def csv_columns(specs: list = LAYERS) -> dict:
+    """読む列と型：BASE_COLUMNS にレイヤー定義の link 列（と instagram なら instagram_url）を足したもの"""
+    cols = dict(BASE_COLUMNS)
+    for spec in specs:
+        cols[spec.get("link", "url")] = str
+        if spec.get("instagram"):
+            cols["instagram_url"] = str
+    return cols
+
+CSV_COLUMNS = csv_columns()
+FRAME_DIR = os.path.join(CACHE_DIR, "frames")
+FRAME_VERSION = 2  # normalize_latlon を変えたら上げる（CSV_COLUMNS はサイドカーのキーに入る）
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+CSV_WORKERS = min(8, os.cpu_count() or 1)
+
+def read_csv_typed(path: str, engine: str = "c") -> pd.DataFrame:
+    header = pd.read_csv(path, nrows=0).columns
+    cols = [c for c in header if c in CSV_COLUMNS]
+    try:
+        return pd.read_csv(path, usecols=cols, dtype={c: CSV_COLUMNS[c] for c in cols}, engine=engine)
+    except ValueError:  # 数値列に文字が混ざっている
+        return pd.read_csv(path, usecols=cols, dtype=str, engine=engine)
+
+def read_frame(path: str, engine: str = "c") -> pd.DataFrame:
+    """normalize_latlon 済みの表（行番号は lat/lon が有効な行の通し番号）"""
+    return normalize_latlon(read_csv_typed(path, engine)).reset_index(drop=True)
+
+def load_frame(path: str, engine: str = "c") -> tuple:
+    """normalize_latlon 済みの表と、かかった時間（--profile の子ステージ）
+    [{"name": "read_sidecar", ...}] か [{"name": "read_csv", ...}, {"name": "normalize_latlon", ...}]"""
+    stat = os.stat(path)
+    stamp = f"{FRAME_VERSION}:{stat.st_mtime_ns}:{stat.st_size}:{cache_key(sorted(CSV_COLUMNS))}"
+    base = os.path.join(FRAME_DIR, os.path.basename(path))
+    data_path = base + (".feather" if HAS_PYARROW else ".pkl")
+    t0 = time.perf_counter()
+    if os.path.exists(base + ".key") and os.path.exists(data_path) and read_text(base + ".key") == stamp:
+        df = pd.read_feather(data_path) if HAS_PYARROW else pd.read_pickle(data_path)
+        return df, [{"name": "read_sidecar", "seconds": round(time.perf_counter() - t0, 6), "rows": len(df)}]
+
+    raw = read_csv_typed(path, engine)
+    t1 = time.perf_counter()
+    df = normalize_latlon(raw).reset_index(drop=True)  # read_frame() と同じ
+    stages = [{"name": "read_csv", "seconds": round(t1 - t0, 6), "rows": len(raw)},
+              {"name": "normalize_latlon", "seconds": round(time.perf_counter() - t1, 6),
+               "rows": len(raw), "objects": len(df)}]
+    os.makedirs(FRAME_DIR, exist_ok=True)
+    if HAS_PYARROW:
+        df.to_feather(data_path)
+    else:
+        df.to_pickle(data_path)
+    with open(base + ".key", "w", encoding="utf-8") as f:
+        f.write(stamp)
+    return df, stages
+
+def load_frames(paths: list, engine: str = "c") -> tuple:
+    """paths を並列に load_frame する。({path: 表}, {path: かかった時間})"""
+    if not paths:
+        return {}, {}
+    with ThreadPoolExecutor(max_workers=min(CSV_WORKERS, len(paths))) as pool:
+        loaded = dict(zip(paths, pool.map(lambda p: load_frame(p, engine), paths)))
+    return {p: df for p, (df, _) in loaded.items()}, {p: stages for p, (_, stages) in loaded.items()}
+
+# =====================
+# 右上 UI（Layers）：定義から凡例・ボタン・トグル対象を生成
+# =====================
+def hex_rgba(color: str, alpha: float) -> str:
+    c = color.lstrip("#")
+    r, g, b = int(c[0:2], 16), int(c[2:4], 16), int(c[4:6], 16)
+    return f"rgba({r},{g},{b},{alpha:g})"
+
+def legend_css(spec: dict) -> str:
+    if spec.get("border"):
+        return f'.on-{spec["key"]} .sq {{ background:transparent;border:1.5px solid {spec["border"]};box-sizing:border-box; }}'
+    return f'.on-{spec["key"]} .sq {{ background:{hex_rgba(spec["color"], round(spec["opacity"] + 0.1, 2))}; }}'
+
+def toggle_control(m: folium.Map, layers: dict, layer_area: folium.FeatureGroup,
+                   specs: list = LAYERS) -> MacroElement:
+    """右上 UI（Layers）：定義（specs）から凡例・ボタン・トグル対象を生成"""
+    legend_css_rules = "\n".join(
+        [legend_css(spec) for spec in specs] + [f".on-area .sq {{ background:{hex_rgba(AREA_COLOR, 0.55)}; }}"]
+    )
+
+    toggle_items = "\n".join(
+        f'  <div class="toggle-item toggle-static on-{spec["key"]}"><span class="sq"></span><span class="label">{spec["name"]}</span></div>'
+        if spec.get("static") else
+        f'  <div class="toggle-item" id="btn-{spec["key"]}"><span class="sq"></span><span class="label">{spec["name"]}</span></div>'
+        for spec in specs
+    ) + f'\n  <div class="toggle-item" id="btn-area"><span class="sq"></span><span class="label">{AREA_NAME}</span></div>'
+
+    toggle_layers_js = ", ".join(
+        f'"{spec["key"]}": {layers[spec["key"]].get_name()}' for spec in specs if not spec.get("static")
+    )
+
+    map_var = m.get_name()
+    area_var = layer_area.get_name()
+
+    template = f"""
+{{% macro html(this, kwargs) %}}
+<style>
+.toggle-box {{
+  position:absolute; top:12px; right:12px; z-index:9999;
+  background:rgba(255,255,255,0.92);
+  border:1px solid rgba(0,0,0,0.15);
+  border-radius:10px; padding:10px; min-width:160px;
+  box-shadow:0 8px 24px rgba(0,0,0,0.12);
+  font-family:system-ui, sans-serif;
+}}
+.toggle-title {{ font-size:12px; color:rgba(0,0,0,0.45); padding-bottom:6px; }}
+.toggle-item {{ display:flex; align-items:center; gap:10px; padding:8px; border-radius:8px; cursor:pointer; user-select:none; }}
+.toggle-item:hover {{ background:rgba(0,0,0,0.04); }}
+.sq {{ width:10px; height:10px; border-radius:2px; background:rgba(160,160,160,0.25); }}
+.label {{ font-size:13px; color:rgba(0,0,0,0.78); }}
+
+{legend_css_rules}
+
+.toggle-item.loading {{ cursor:progress; }}
+.toggle-item.loading .sq {{ animation:sq-pulse 0.8s ease-in-out infinite alternate; }}
+@keyframes sq-pulse {{ from {{ opacity:1; }} to {{ opacity:0.25; }} }}
+
+.toggle-static {{ cursor:default; }}
+.toggle-static:hover {{ background:transparent; }}
+
+@media (max-width:600px) {{
+  .toggle-box {{ top:8px; right:8px; padding:6px; min-width:120px; opacity:0.88; }}
+  .toggle-title {{ font-size:10px; padding-bottom:4px; }}
+  .toggle-item {{ padding:5px 6px; gap:6px; }}
+  .label {{ font-size:11px; }}
+  .sq {{ width:8px; height:8px; }}
+}}
+</style>
+
+<div class="toggle-box" id="customToggle">
+  <div class="toggle-title">Layers</div>
+{toggle_items}
+</div>
+
+<script>
+(function(){{
+  function init() {{
+    var map = {map_var};
+    var layers = {{{toggle_layers_js}}};
+    var larea = {area_var};
+
+    var br=document.getElementById("btn-area"),
+        box=document.getElementById("customToggle");
+    var buttons = {{}};
+    for (var k in layers) buttons[k] = document.getElementById("btn-" + k);
+
+    for (var k in buttons) if(!buttons[k]){{setTimeout(init,50);return;}}
+    if(!br||!box||typeof map==="undefined"){{setTimeout(init,50);return;}}
+
+    if(window.L&&L.DomEvent){{L.DomEvent.disableClickPropagation(box);L.DomEvent.disableScrollPropagation(box);}}
+
+    function set(b,on,c){{on?b.classList.add(c):b.classList.remove(c);}}
+    function safeHas(layer){{ try {{ return map.hasLayer(layer); }} catch(e){{ return false; }} }}
+    // 未読み込みのレイヤー（--lazy）は読み込み中の表示をしてから追加
+    function toggle(layer, btn, cls){{
+      if(!layer || btn.classList.contains("loading")) return;
+      if(safeHas(layer)){{ map.removeLayer(layer); set(btn,false,cls); return; }}
+      set(btn,true,"loading");
+      SetoMap.load(layer).then(function(){{
+        set(btn,false,"loading");
+        map.addLayer(layer); set(btn,true,cls);
+      }}, function(){{ set(btn,false,"loading"); }});
+    }}
+
+    // 初期状態の色
+    for (var k in layers) set(buttons[k], safeHas(layers[k]), "on-" + k);
+    set(br,safeHas(larea),"on-area");
+
+    // トグル
+    Object.keys(buttons).forEach(function(k){{
+      buttons[k].onclick=function(){{ toggle(layers[k], buttons[k], "on-" + k); }};
+    }});
+    br.onclick=function(){{ toggle(larea, br, "on-area"); }};
+  }}
+  if(document.readyState==="loading")document.addEventListener("DOMContentLoaded",init);else init();
+}})();
+</script>
+{{% endmacro %}}
+"""
+
+
+    control = MacroElement()
+    control._template = Template(template)
+    return control
+
+# =====================
+# 計測（--profile）
+# - ステージごとに 時間・処理行数・作ったオブジェクト数（JSで作られるマーカー等）・tracemalloc ピーク（開始時からの増分）
+# - ステージは入れ子にできる（親のピークは子のピークも含む、時間も子を含む）
+# - --cprofile は一番遅い最上位ステージの cProfile を書く（計測中は各最上位ステージを cProfile する）
+# =====================
+class StageProfile:
+    def __init__(self, enabled: bool = False, cprofile: bool = False):
+        self.enabled = enabled
+        self.cprofile = cprofile
+        self.stages = []
+        self._stack = []
+        self._slowest = None  # (秒, 名前, cProfile.Profile)
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str, target: str = None):
+        """with prof.stage("layer", key) as st: ... st["rows"] = n"""
+        rec = {"name": name} if target is None else {"name": name, "target": target}
+        if not self.enabled:
+            yield rec
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        if self._stack:  # 親のピークは reset_peak で消えるので先に控えておく
+            self._stack[-1][2] = max(self._stack[-1][2], peak)
+        rec["depth"] = len(self._stack)
+        self.stages.append(rec)
+        frame = [rec, current, 0]  # [記録, 開始時の確保量, このステージ中のピーク（絶対値）]
+        self._stack.append(frame)
+        profiler = cProfile.Profile() if self.cprofile and rec["depth"] == 0 else None
+        tracemalloc.reset_peak()
+        t0 = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield rec
+        finally:
+            if profiler:
+                profiler.disable()
+            rec["seconds"] = round(time.perf_counter() - t0, 6)
+            frame[2] = max(frame[2], tracemalloc.get_traced_memory()[1])
+            rec["peak_bytes"] = frame[2] - frame[1]  # 開始時より増えた分
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1][2] = max(self._stack[-1][2], frame[2])
+            if profiler and (self._slowest is None or rec["seconds"] > self._slowest[0]):
+                self._slowest = (rec["seconds"], rec["name"] + (f":{rec['target']}" if "target" in rec else ""), profiler)
+
+    def record(self, name: str, target: str = None, **fields) -> None:
+        """ほかのスレッドで計った時間を今のステージの子として足す（メモリは計れないので peak_bytes は無し）"""
+        if self.enabled:
+            rec = {"name": name} if target is None else {"name": name, "target": target}
+            rec.update(fields, depth=len(self._stack))
+            self.stages.append(rec)
+
+    def write(self, path: str, args: argparse.Namespace, total: float) -> None:
+        trace = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "args": {k: v for k, v in vars(args).items() if k not in ("profile", "cprofile")},
+            "total_seconds": round(total, 6),
+            "stages": self.stages,
+        }
+        if self._slowest:
+            prof_path = os.path.splitext(path)[0] + ".prof"
+            self._slowest[2].dump_stats(prof_path)
+            trace["cprofile"] = {"stage": self._slowest[1], "path": prof_path}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(trace, f, ensure_ascii=False, indent=1)
+
+        print(f"profile: {path}")
+        for rec in sorted(self.stages, key=lambda r: -r["seconds"])[:10]:
+            label = "  " * rec["depth"] + rec["name"] + (f":{rec['target']}" if "target" in rec else "")
+            extra = "".join(f" {k}={rec[k]}" for k in ("rows", "objects", "cached") if k in rec)
+            mem = f"{rec['peak_bytes'] / 2**20:8.1f} MiB" if "peak_bytes" in rec else " " * 12
+            print(f"  {label:<36} {rec['seconds']:8.3f}s {mem}{extra}")
+        if self._slowest:
+            print(f"  cProfile ({self._slowest[1]}): {trace['cprofile']['path']}")
+
+# =====================
+# 地図の設定（バリアント）
+# - 1つのバリアント = DEFAULT_CONFIG を上書きする dict
+#   name      : キャッシュ（CACHE_DIR/<name>/）と --profile の名前（"" は既定の地図）
+#   output    : 出力HTML（--lazy / --tiles のデータもこの隣）
+#   center / zoom : 初期表示
+#   bbox      : [s, w, n, e] の範囲の点・島・地域だけ出す（None は全部）
+#   layers    : 出すレイヤーの key（None は LAYERS 全部）
+#   show      : 最初から表示するレイヤーの key（None は LAYERS の show のまま、static は常に表示）
+#   sizes     : {key: px} マーカーの大きさ
+#   name_zoom : NAME_ZOOM の代わり
+# - --variants：CSV は親プロセスで1回だけ読み、各バリアントを別プロセスで並列に build する
+# =====================
+DEFAULT_CONFIG = {
+    "name": "",
+    "output": OUTPUT_HTML,
+    "center": [34.295, 132.81],
+    "zoom": 12,
+    "bbox": None,
+    "layers": None,
+    "show": None,
+    "sizes": {},
+    "name_zoom": NAME_ZOOM,
+}
+
+VARIANTS = [
+    {"name": "akitsu", "output": "variants/akitsu.html", "center": [34.323, 132.818], "zoom": 13,
+     "bbox": [34.22, 132.68, 34.42, 132.95]},
+    {"name": "takehara", "output": "variants/takehara.html", "center": [34.342, 132.907], "zoom": 13,
+     "bbox": [34.25, 132.80, 34.45, 133.02]},
+    {"name": "mihara", "output": "variants/mihara.html", "center": [34.398, 133.079], "zoom": 13,
+     "bbox": [34.28, 132.97, 34.47, 133.20]},
+    {"name": "sake", "output": "variants/sake.html", "layers": ["otafuku", "sake"], "show": ["sake"]},
+    {"name": "mobile", "output": "variants/mobile.html", "name_zoom": 12,
+     "sizes": {spec["key"]: 10 for spec in LAYERS}},
+]
+
+def resolve_config(variant: dict = None) -> dict:
+    """DEFAULT_CONFIG に variant を重ね、specs（このバリアントの LAYERS）を足して返す"""
+    config = {**DEFAULT_CONFIG, **(variant or {})}
+    unknown = set(config) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"unknown variant keys: {sorted(unknown)}")
+    specs = []
+    for spec in LAYERS:
+        if config["layers"] is not None and spec["key"] not in config["layers"]:
+            continue
+        spec = dict(spec)
+        if config["show"] is not None and not spec.get("static"):
+            spec["show"] = spec["key"] in config["show"]
+        spec["size"] = config["sizes"].get(spec["key"], spec["size"])
+        specs.append(spec)
+    config["specs"] = specs
+    return config
+
+def clip_bbox(df: pd.DataFrame, bbox: list = None) -> pd.DataFrame:
+    if bbox is None:
+        return df
+    s, w, n, e = bbox
+    return df[df["lat"].between(s, n) & df["lon"].between(w, e)]
+
+# =====================
+# 地図（folium）の組み立て
+# =====================
+def make_map(args, config: dict, tiled: dict = None, srcs: dict = None,
+             output: str = OUTPUT_HTML) -> tuple:
+    """地図（folium.Map）と --assets files で書いたファイルの相対URLを返す。データは DATA_MARK のまま
+    tiled = {レイヤーkey: tile_source()}（--tiles）、srcs = {key: 別ファイルの相対URL}（--lazy）"""
+    specs = config["specs"]
+    tiled, srcs = tiled or {}, srcs or {}
+
+    # =====================
+    # 地図（ベース）
+    # =====================
+    m = folium.Map(
+        location=config["center"],
+        zoom_start=config["zoom"],
+        tiles=None,
+        prefer_canvas=args.canvas  # --canvas：島の dot（CircleMarker）も同じ canvas に描く
+    )
+
+    folium.TileLayer(
+        tiles="https://{s}.basemaps.cartocdn.com/light_nolabels/{z}/{x}/{y}{r}.png",
+        attr="© CARTO, © OpenStreetMap",
+        control=False
+    ).add_to(m)
+
+    SetoRuntime(specs, bool(args.nearby)).add_to(m)
+
+    # --assets inline / files：外部ライブラリは Leaflet だけ、VENDOR_DIR のコピーから
+    asset_files = use_assets(m, args.assets, output) if args.assets != "cdn" else []
+
+    # =====================
+    # POI レイヤー（定義から一括生成）
+    # --lazy：初期非表示のレイヤーは別ファイル（初回トグル時に読み込む）
+    # --tiles：表示範囲の静的タイルを読み込む
+    # --canvas：四角は div ではなく canvas に描く
+    # =====================
+    # --density：args.density 以下のズームでは点の代わりに密度（DensityLayer）を描く
+    layers = {}
+    for spec in specs:
+        if spec["key"] in tiled:
+            layers[spec["key"]] = PointTileLayer(spec, tiled[spec["key"]], args.canvas, args.density)
+        elif spec["key"] in srcs:
+            layers[spec["key"]] = PointLayer(spec, src=srcs[spec["key"]], canvas=args.canvas, density=args.density)
+        else:
+            layers[spec["key"]] = PointLayer(spec, DATA_MARK.format(spec["key"]), canvas=args.canvas,
+                                             density=args.density)
+
+    # =====================
+    # 地域・島（濃いグレー）
+    # - 島：ズームで dot / name / 非表示 を切り替え（min_zoom）
+    # - zoom>=NAME_ZOOM で「全島 name」
+    # - スマホは NAME_ZOOM と min_zoom を -MOBILE_ZOOM_BOOST して広域で出す
+    # - 切り替えはしきい値をまたいだ島だけ（island_zoom_rules）
+    # =====================
+    if "area" in srcs:
+        layer_area = AreaLayer(AREA_NAME, AREA_COLOR, src=srcs["area"])
+    else:
+        layer_area = AreaLayer(AREA_NAME, AREA_COLOR, DATA_MARK.format("area"))
+
+    # =====================
+    # 地図に追加（順番重要：密度がいちばん下、on_top のレイヤーは地域・島より上）
+    # =====================
+    if args.density is not None:
+        DensityLayer(specs, DATA_MARK.format("density")).add_to(m)
+    for spec in specs:
+        if not spec.get("on_top"):
+            layers[spec["key"]].add_to(m)
+    layer_area.add_to(m)
+    for spec in specs:
+        if spec.get("on_top"):
+            layers[spec["key"]].add_to(m)
+
+    m.get_root().add_child(toggle_control(m, layers, layer_area, specs))
+
+    # 検索（--lazy なら索引は別ファイル、初回入力時に読み込む）
+    if args.search:
+        if "search" in srcs:
+            m.get_root().add_child(SearchBox(m, layers, layer_area, src=srcs["search"]))
+        else:
+            m.get_root().add_child(SearchBox(m, layers, layer_area, DATA_MARK.format("search")))
+    return m, asset_files
+
+# =====================
+# ビルド
+# =====================
+def build(args, variant: dict = None, frames: dict = None) -> bool:
+    """変わったレイヤーだけ作り直して config["output"] を書く。何も変わっていなければ False
+    frames（{CSVパス: normalize_latlon 済みの表}）があればそれを使う"""
+    config = resolve_config(variant)
+    prof = StageProfile(bool(args.profile), bool(args.cprofile))
+    t0 = time.perf_counter()
+    try:
+        return build_stages(args, config, prof, dict(frames or {}))
+    finally:
+        if prof.enabled:
+            path = args.profile
+            if config["name"]:
+                root, ext = os.path.splitext(path)
+                path = f"{root}-{config['name']}{ext}"
+            prof.write(path, args, time.perf_counter() - t0)
+
+def build_stages(args, config: dict, prof: StageProfile, frames: dict) -> bool:
+    specs, output, bbox = config["specs"], config["output"], config["bbox"]
+    cache = (config["name"] + "/") if config["name"] else ""  # キャッシュの名前の前置き
+
+    with prof.stage("hash_csv") as st:
+        hashes = {path: file_hash(path) for path in csv_paths(specs)}
+        st["rows"] = len(hashes)
+    options = {"cluster": args.cluster, "cull": args.cull, "bbox": bbox}  # payload の中身に効くオプション
+
+    # CSV読み込み（同じCSVは1回だけ、キャッシュが効かないレイヤーの分だけ。まとめて並列に読む）
+    # CSV ごとの read_csv / normalize_latlon（サイドカーなら read_sidecar）は読んだステージの子として記録
+    def record_loads(timings: dict) -> None:
+        for path, stages in timings.items():
+            for rec in stages:
+                prof.record(target=path, **rec)
+
+    def frame(path: str) -> pd.DataFrame:
+        if path not in frames:
+            frames[path], stages = load_frame(path, args.csv_engine)
+            record_loads({path: stages})
+        return frames[path]
+
+    # --dedupe：全レイヤーをまたいだ重複（どれかの CSV が変わったときだけ探し直す）
+    dupes = None
+    if args.dedupe:
+        dupes_key = cache_key(code_hash(), [hashes[spec["csv"]] for spec in specs], specs, bbox, args.dedupe_distance)
+        with prof.stage("dedupe") as st:
+            st["cached"] = True
+            def make_dupes():
+                paths = [p for p in dict.fromkeys(spec["csv"] for spec in specs) if p not in frames]
+                loaded, timings = load_frames(paths, args.csv_engine)
+                frames.update(loaded)
+                record_loads(timings)
+                points = {spec["key"]: clip_bbox(layer_points(spec, frames[spec["csv"]]), bbox) for spec in specs}
+                report = find_duplicates(points, args.dedupe_distance)
+                st.update(rows=report["rows"], objects=len(report["groups"]), cached=False)
+                return report
+            dupes = json.loads(cached_fragment(cache + "dupes", dupes_key, make_dupes))
+        report_path = os.path.splitext(output)[0] + "-dupes.json"
+        os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(dupes, f, ensure_ascii=False, indent=1)
+        print(f"dupes: {len(dupes['groups'])} groups, {sum(map(len, dupes['drop'].values()))} rows"
+              f" ({args.dedupe}) -> {report_path}")
+        if args.dedupe == "report":
+            dupes = None
+        else:
+            options["dedupe"] = [args.dedupe, dupes_key]
+    merge = args.dedupe == "merge"
+
+    # --tiles：static 以外のレイヤーはタイルに書き出す（CSV ごとに、変わったものだけ）
+    keys = {}
+    tiled = {}
+    if args.tiles:
+        zooms = range(args.tile_zooms[0], args.tile_zooms[1] + 1)
+        for path in csv_paths(specs):
+            tile_specs = [spec for spec in specs if spec["csv"] == path and not spec.get("static")]
+            if not tile_specs:
+                continue
+            key = cache_key(code_hash(), hashes[path], tile_specs, zooms.start, zooms.stop, bbox, os.path.abspath(output),
+                            options.get("dedupe"))
+            # 各レイヤーのタイルの置き場に key を書いておき、消えていたら（キャッシュが新しくても）書き出し直す
+            stamps = [tile_stamp(spec["key"], output) for spec in tile_specs]
+            on_disk = all(os.path.exists(p) and read_text(p) == key for p in stamps)
+            with prof.stage("tiles", path) as st:
+                st["cached"] = True
+                def make_tiles(path=path, tile_specs=tile_specs, stamps=stamps, key=key, st=st):
+                    st["cached"] = False
+                    bounds = export_tiles(path, tile_specs, zooms, output, bbox, dupes, merge)
+                    for stamp in stamps:
+                        os.makedirs(os.path.dirname(stamp), exist_ok=True)
+                        with open(stamp, "w", encoding="utf-8") as f:
+                            f.write(key)
+                    return bounds
+                bounds = json.loads(cached_fragment(
+                    cache + "tiles-" + os.path.splitext(os.path.basename(path))[0], key, make_tiles, not on_disk
+                ))
+            for spec in tile_specs:
+                keys[spec["key"]] = key
+                tiled[spec["key"]] = tile_source(spec["key"], zooms, bounds.get(spec["key"]), output)
+
+    # --nearby：参照先はタイルにしないレイヤー全部なので、どれかの CSV が変わったら全レイヤー作り直し
+    near_specs = [spec for spec in specs if spec["key"] not in tiled]
+    if args.nearby:
+        options["nearby"] = cache_key([hashes[spec["csv"]] for spec in near_specs], near_specs,
+                                      args.nearby, args.nearby_meters)
+    for spec in specs:
+        if spec["key"] not in tiled:
+            keys[spec["key"]] = cache_key(code_hash(), hashes[spec["csv"]], spec, options)
+    keys["area"] = cache_key(code_hash(), hashes[ISLANDS_CSV], hashes[REGIONS_CSV], AREA_COLOR,
+                             bbox, config["name_zoom"], args.declutter)
+
+    stale = [spec["csv"] for spec in specs
+             if spec["key"] not in tiled and not fragment_is_fresh(cache + spec["key"], keys[spec["key"]])]
+    if not fragment_is_fresh(cache + "area", keys["area"]):
+        stale += [ISLANDS_CSV, REGIONS_CSV]
+    with prof.stage("load_csv") as st:
+        stale = [path for path in dict.fromkeys(stale) if path not in frames]
+        loaded, timings = load_frames(stale, args.csv_engine)
+        frames.update(loaded)
+        record_loads(timings)
+        st.update(rows=sum(len(df) for df in loaded.values()), objects=len(loaded),
+                  cached=sum(stages[0]["name"] == "read_sidecar" for stages in timings.values()))
+
+    def points(spec: dict) -> pd.DataFrame:
+        return drop_duplicates(clip_bbox(layer_points(spec, frame(spec["csv"])), bbox), spec["key"], dupes, merge)
+
+    near = {}  # 最初に作り直すレイヤーで全レイヤー分まとめて探す
+    def near_refs(key: str) -> dict:
+        if not args.nearby:
+            return None
+        if not near:
+            with prof.stage("nearby") as st:
+                pts = {spec["key"]: payload_points(points(spec), args.cull) for spec in near_specs}
+                near.update(nearby_refs(pts, args.nearby, args.nearby_meters))
+                st.update(rows=sum(map(len, pts.values())), objects=len(pts))
+        return near[key]
+
+    fragments = {}
+    for spec in specs:
+        if spec["key"] in tiled:
+            continue
+        with prof.stage("layer", spec["key"]) as st:
+            st["cached"] = True
+            def make_layer(spec=spec, st=st):
+                pts = points(spec)
+                payload = layer_payload(pts, args.cluster, args.cull, near_refs(spec["key"]))
+                st.update(rows=len(pts), objects=len(payload["rows"]), cached=False)
+                return payload
+            fragments[spec["key"]] = ensure_fragment(cache + spec["key"], keys[spec["key"]], make_layer)
+
+    with prof.stage("island_rules") as st:
+        st["cached"] = True
+        def make_area():
+            payload = area_payload(clip_bbox(frame(ISLANDS_CSV), bbox), clip_bbox(frame(REGIONS_CSV), bbox),
+                                   config["name_zoom"], args.declutter)
+            # 島は dot + label、地域は label
+            st.update(rows=len(payload["islands"]) + len(payload["regions"]),
+                      objects=2 * len(payload["islands"]) + len(payload["regions"]), cached=False)
+            return payload
+        fragments["area"] = ensure_fragment(cache + "area", keys["area"], make_area)
+
+    # --density：--tiles のレイヤーも含めた全点（どれかの CSV が変わったときだけ集計し直す）
+    if args.density is not None:
+        keys["density"] = cache_key(code_hash(), [hashes[spec["csv"]] for spec in specs], specs, bbox,
+                                    options.get("dedupe"), args.density)
+        with prof.stage("density") as st:
+            st["cached"] = True
+            def make_density():
+                pts = {spec["key"]: points(spec) for spec in specs}
+                payload = density_levels(pts, max_zoom=args.density)
+                st.update(rows=sum(map(len, pts.values())), objects=sum(map(len, payload["levels"].values())),
+                          cached=False)
+                return payload
+            fragments["density"] = ensure_fragment(cache + "density", keys["density"], make_density)
+    frames.clear()  # ここから先は payload ファイルだけ使う
+
+    # --search：payload の name から索引を作る（どれかのレイヤーか地域・島が変わったときだけ）
+    if args.search:
+        searchable = [spec for spec in specs if spec["key"] not in tiled]
+        keys["search"] = cache_key(code_hash(), [keys[spec["key"]] for spec in searchable], keys["area"],
+                                   [spec["name"] for spec in searchable], pykakasi is not None)
+        with prof.stage("search_index") as st:
+            st["cached"] = True
+            def make_search():
+                names = {spec["key"]: [r[2] for r in read_fragment(fragments[spec["key"]])["rows"]]
+                         for spec in searchable}
+                index = search_payload(searchable, names, read_fragment(fragments["area"]))
+                st.update(rows=len(index["names"]), objects=len(index["grams"]), cached=False)
+                return index
+            fragments["search"] = ensure_fragment(cache + "search", keys["search"], make_search)
+
+    vendor = ([file_hash(vendor_path(url)) for url in vendor_urls() if os.path.exists(vendor_path(url))]
+              if args.assets != "cdn" else None)
+    build_key = cache_key(keys, args.lazy, args.canvas, args.minify, args.precompress, args.assets, vendor,
+                          args.nearby, {k: v for k, v in config.items() if k != "specs"}, os.path.abspath(output))
+    # build.key：1行目がキー、2行目から前回書いた隣のファイル（output からの相対パス）。1つでも消えていれば作り直す
+    build_key_path = os.path.join(CACHE_DIR, cache + "build.key")
+    base = os.path.dirname(os.path.abspath(output))
+    if os.path.exists(output) and os.path.exists(build_key_path):
+        key, *written = read_text(build_key_path).splitlines()
+        if key == build_key and all(os.path.exists(os.path.join(base, url)) for url in written):
+            print("up to date:", output)
+            return False
+
+    # --lazy：初期非表示のレイヤー・地域と島・検索索引は別ファイル（初回に読み込む）
+    srcs = {}
+    if args.lazy:
+        lazy = [spec["key"] for spec in specs if spec["key"] not in tiled and not spec["show"]]
+        for key in lazy + ["area"] + (["search"] if args.search else []):
+            srcs[key] = write_data_file(key, fragments[key], output)
+    m, asset_files = make_map(args, config, tiled, srcs, output)
+    data_files = asset_files + list(srcs.values())  # --precompress の対象
+
+    # =====================
+    # 保存
+    # =====================
+    # 骨組み（データは DATA_MARK）だけ render し、データはキャッシュから流し込む
+    with prof.stage("render") as st:
+        skeleton = m.get_root().render()
+        if args.minify:
+            skeleton = minify_html(skeleton)
+        st["objects"] = len(specs) + 1
+    with prof.stage("save") as st:
+        os.makedirs(base, exist_ok=True)
+        st["chars"] = write_html(output, skeleton, fragments)
+        written = list(data_files)
+        for url in [os.path.basename(output)] + data_files:
+            if args.precompress:
+                written += [os.path.relpath(p, base) for p in precompress(os.path.join(base, url))]
+            else:
+                remove_compressed(os.path.join(base, url))
+    with open(build_key_path, "w", encoding="utf-8") as f:
+        f.write("\n".join([build_key] + written))
+    print("saved:", output)
+    return True
+
+# =====================
+# ビルド（メモリ上、ファイルは書かない）
+# - build_map()：config と表から HTML を文字列で返す（--serve もこれを使う）
+# - payload はディスクのキャッシュではなく cache（dict / LRUCache）に JSON 文字列で置く
+#   キーは (種類, 名前, ((CSV パス, 版), ...), 中身に効く設定のハッシュ)。版が変わったら --serve が捨てる
+# =====================
+def build_map(config: dict = None, data: dict = None, args: argparse.Namespace = None,
+              cache=None, versions: dict = None) -> str:
+    """地図の HTML を返す
+    config   : DEFAULT_CONFIG を上書きする dict（バリアントと同じ形、output は使わない）
+    data     : {CSV パス: read_frame() の表}。無い CSV はここで読む
+    args     : parse_args() の結果（既定はオプション無し）。ファイルを書く --lazy / --tiles / --assets files は不可
+    cache    : payload を置く dict か LRUCache（versions = {CSV パス: 版} があるときだけ使う）"""
+    args = args or parse_args([])
+    if args.lazy or args.tiles or args.assets == "files":
+        raise ValueError("build_map() does not write files: --lazy, --tiles and --assets files are not supported")
+    config = resolve_config(config)
+    specs, bbox = config["specs"], config["bbox"]
+    frames = dict(data or {})
+    frames.update({path: read_frame(path, args.csv_engine) for path in csv_paths(specs) if path not in frames})
+
+    def cached(kind: str, name: str, paths: list, parts: list, make) -> str:
+        if cache is None or versions is None:
+            return to_js(make())
+        key = (kind, name, tuple((p, versions[p]) for p in paths), cache_key(code_hash(), parts))
+        js = cache.get(key)
+        if js is None:
+            js = cache[key] = to_js(make())
+        return js
+
+    dupes, dupe_parts = None, None
+    if args.dedupe in ("skip", "merge"):
+        points = {spec["key"]: clip_bbox(layer_points(spec, frames[spec["csv"]]), bbox) for spec in specs}
+        dupes = find_duplicates(points, args.dedupe_distance)
+        dupe_parts = [args.dedupe, args.dedupe_distance, specs, sorted(csv_paths(specs))]
+    options = {"cluster": args.cluster, "cull": args.cull, "bbox": bbox, "dedupe": dupe_parts,
+               "nearby": [args.nearby, args.nearby_meters, specs] if args.nearby else None}
+
+    def points(spec: dict) -> pd.DataFrame:
+        pts = clip_bbox(layer_points(spec, frames[spec["csv"]]), bbox)
+        return drop_duplicates(pts, spec["key"], dupes, args.dedupe == "merge")
+
+    near = {}
+    def near_refs(key: str) -> dict:
+        if not args.nearby:
+            return None
+        if not near:
+            near.update(nearby_refs({spec["key"]: payload_points(points(spec), args.cull) for spec in specs},
+                                    args.nearby, args.nearby_meters))
+        return near[key]
+
+    js = {}
+    for spec in specs:
+        def make_layer(spec=spec):
+            return layer_payload(points(spec), args.cluster, args.cull, near_refs(spec["key"]))
+        paths = csv_paths(specs) if dupes or args.nearby else [spec["csv"]]
+        js[spec["key"]] = cached("layer", spec["key"], paths, [spec, options], make_layer)
+    js["area"] = cached("area", "area", [ISLANDS_CSV, REGIONS_CSV], [bbox, config["name_zoom"], args.declutter],
+                        lambda: area_payload(clip_bbox(frames[ISLANDS_CSV], bbox), clip_bbox(frames[REGIONS_CSV], bbox),
+                                             config["name_zoom"], args.declutter))
+    if args.search:
+        def make_search():
+            names = {spec["key"]: [r[2] for r in json.loads(js[spec["key"]])["rows"]] for spec in specs}
+            return search_payload(specs, names, json.loads(js["area"]))
+        js["search"] = cached("search", "search", csv_paths(specs),
+                              [specs, options, config["name_zoom"], args.declutter, pykakasi is not None], make_search)
+    if args.density is not None:
+        js["density"] = cached("density", "density", csv_paths(specs), [specs, bbox, dupe_parts, args.density],
+                               lambda: density_levels({spec["key"]: points(spec) for spec in specs},
+                                                      max_zoom=args.density))
+
+    m, _ = make_map(args, config)
+    skeleton = m.get_root().render()
+    if args.minify:
+        skeleton = minify_html(skeleton)
+    return DATA_MARK_RE.sub(lambda match: js[match.group(1)], skeleton)
+
+# =====================
+# バリアントの一括ビルド（--variants）
+# - 親で全バリアントが使う CSV を1回だけ load_frames し、ワーカープロセスの起動時に1回だけ渡す
+# - 各バリアントはキャッシュ・出力が別なので並列に build してよい
+# =====================
+WORKER_FRAMES = {}
+
+def init_variant_worker(frames: dict) -> None:
+    WORKER_FRAMES.update(frames)
+
+def build_variant(args, variant: dict) -> bool:
+    return build(args, variant, WORKER_FRAMES)
+
+def load_variants(path: str) -> list:
+    """--variants PATH（JSON のリスト）、PATH が無ければ VARIANTS"""
+    if not path:
+        return VARIANTS
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def build_variants(args, variants: list) -> list:
+    """variants を並列に build し、作り直したかどうかのリストを返す"""
+    configs = [resolve_config(v) for v in variants]  # 不正なキーはここで落とす
+    names = [c["name"] for c in configs]
+    if "" in names or len(set(names)) != len(names):
+        raise ValueError("each variant needs a unique non-empty name")
+    paths = list(dict.fromkeys(p for c in configs for p in csv_paths(c["specs"])))
+    frames, _ = load_frames(paths, args.csv_engine)
+
+    jobs = args.jobs or min(len(variants), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_variant_worker, initargs=(frames,)) as pool:
+        futures = [pool.submit(build_variant, args, v) for v in variants]
+        return [f.result() for f in futures]
+
+def run(args) -> None:
+    if args.variants is not None:
+        build_variants(args, load_variants(args.variants))
+    else:
+        build(args)
+
+def watch(args) -> None:
+    """CSV の mtime / サイズを見張り、変わるたびに build() する（Ctrl-C で終了）"""
+    last = None
+    while True:
+        stamp = [(p, os.stat(p).st_mtime_ns, os.stat(p).st_size) for p in csv_paths() if os.path.exists(p)]
+        if stamp != last:
+            last = stamp
+            try:
+                run(args)
+            except Exception as e:  # 編集途中の CSV などで落ちても見張りは続ける
+                print("build failed:", e)
+        time.sleep(args.interval)
+
+# =====================
+# ローカル配信（--serve）
+# - GET /?variant=akitsu&layers=sake,jinja&show=sake&bbox=s,w,n,e&center=lat,lon&zoom=12&name_zoom=13
+#   （どれも任意。variant は VARIANTS の name、他はその上に重ねる）
+# - CSV は表のまま常駐し、リクエストごとに mtime・サイズを見て変わった CSV だけ読み直す
+# - payload（build_map の cache）とページ全体を LRUCache に置く。CSV が変わったらその CSV を使う項目を捨てる
+# - オプション（--cluster など）は起動時のもの
+# =====================
+SERVE_CACHE_SIZE = 256
+
+class LRUCache:
+    """最近使った maxsize 個だけ残す dict（スレッド間で共有してよい）"""
+    def __init__(self, maxsize: int = SERVE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def __setitem__(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def discard_if(self, stale) -> int:
+        """stale(key) が真の項目を捨て、その数を返す"""
+        with self._lock:
+            keys = [k for k in self._data if stale(k)]
+            for k in keys:
+                del self._data[k]
+            return len(keys)
+
+def query_config(query: dict) -> dict:
+    """parse_qs() の結果 → build_map() の config"""
+    def one(name: str):
+        return query[name][-1] if query.get(name) else None
+    def floats(name: str, n: int) -> list:
+        v = [float(x) for x in one(name).split(",")]
+        if len(v) != n:
+            raise ValueError(f"{name} needs {n} numbers")
+        return v
+
+    config = {}
+    if one("variant"):
+        named = {v["name"]: v for v in VARIANTS}
+        if one("variant") not in named:
+            raise ValueError(f"unknown variant: {one('variant')}")
+        config.update(named[one("variant")])
+    keys = {spec["key"] for spec in LAYERS}
+    for name in ("layers", "show"):
+        if one(name) is not None:
+            config[name] = [k for k in one(name).split(",") if k]
+            if set(config[name]) - keys:
+                raise ValueError(f"unknown layers: {sorted(set(config[name]) - keys)}")
+    if one("bbox"):
+        config["bbox"] = floats("bbox", 4)
+    if one("center"):
+        config["center"] = floats("center", 2)
+    if one("zoom"):
+        config["zoom"] = int(one("zoom"))
+    if one("name_zoom"):
+        config["name_zoom"] = float(one("name_zoom"))
+    config.pop("output", None)
+    return config
+
+class MapService:
+    """--serve の中身（HTTP を介さずに page() を呼んでもよい）"""
+    def __init__(self, args: argparse.Namespace, cache_size: int = SERVE_CACHE_SIZE):
+        self.args = args
+        self.frames = {}  # {CSV パス: (版, 表)}
+        self.fragments = LRUCache(cache_size)
+        self.pages = LRUCache(cache_size)
+        self._lock = threading.Lock()
+
+    def refresh(self) -> dict:
+        """変わった CSV を読み直し、古い版を使う項目を捨てて {CSV パス: 版} を返す"""
+        with self._lock:
+            versions, changed = {}, []
+            for path in csv_paths():
+                stat = os.stat(path)
+                versions[path] = f"{stat.st_mtime_ns}:{stat.st_size}"
+                if self.frames.get(path, (None,))[0] != versions[path]:
+                    self.frames[path] = (versions[path], read_frame(path, self.args.csv_engine))
+                    changed.append(path)
+            if changed:
+                def stale(key):
+                    return any(versions.get(p) != v for p, v in key[2])
+                n = self.fragments.discard_if(stale) + self.pages.discard_if(stale)
+                if n:
+                    print(f"  reloaded {', '.join(changed)} (dropped {n} cached items)")
+            return versions
+
+    def page(self, config: dict) -> tuple:
+        """(HTML, ページのキャッシュに当たったか)"""
+        versions = self.refresh()
+        key = ("page", to_js(config), tuple(sorted(versions.items())))
+        html = self.pages.get(key)
+        if html is not None:
+            return html, True
+        data = {path: df for path, (_, df) in self.frames.items()}
+        html = build_map(config, data, self.args, self.fragments, versions)
+        self.pages[key] = html
+        return html, False
+
+def serve(args: argparse.Namespace) -> None:
+    service = MapService(args, args.cache_size)
+    service.refresh()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            if url.path not in ("/", "/" + OUTPUT_HTML):
+                self.send_error(404)
+                return
+            t0 = time.perf_counter()
+            try:
+                # ?layers= は「レイヤー無し」なので空の値も残す
+                query = urllib.parse.parse_qs(url.query, keep_blank_values=True)
+                html, hit = service.page(query_config(query))
+            except ValueError as e:
+                self.send_error(400, str(e))
+                return
+            body = html.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("X-Seto-Cache", "hit" if hit else "miss")
+            self.send_header("Server-Timing", f"build;dur={(time.perf_counter() - t0) * 1000:.1f}")
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.serve), Handler)
+    print(f"serving: http://127.0.0.1:{args.serve}/  (Ctrl-C で終了)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="瀬戸内マップ（seto-map.html）を生成する")
+    parser.add_argument(
+        "--lazy", action="store_true",
+        help="初期非表示のレイヤーを <output>-data/*.json に分け、初回トグル時に読み込む"
+             "（fetch を使うので http(s) で配信すること）"
+    )
+    parser.add_argument(
+        "--cluster", action="store_true",
+        help="ズームごとのクラスタをビルド時に計算して埋め込む（zoomend で入れ替えるだけ）"
+    )
+    parser.add_argument(
+        "--cull", action="store_true",
+        help="点を空間順に並べてブロック索引を付け、表示範囲（+余白）の点だけ地図に置く"
+    )
+    parser.add_argument(
+        "--declutter", action="store_true",
+        help="島・地域のラベルをズームごとに重ならないものだけ出す（ビルド時に配置を計算、min_zoom の手調整が要らない）"
+    )
+    parser.add_argument(
+        "--search", action="store_true",
+        help="POI・島・地域の name の検索索引（bigram、カタカナ/ひらがな同一視、pykakasi があればローマ字も）を"
+             "埋め込み、Layers に検索欄を出す（--tiles のレイヤーは対象外）"
+    )
+    parser.add_argument(
+        "--dedupe", choices=["report", "skip", "merge"],
+        help="全レイヤーをまたいで同じ name（正規化）の近い点を探し <output>-dupes.json に書く。"
+             "skip は重複を落とし、merge は落とした上で残す点の空の url を埋める"
+    )
+    parser.add_argument(
+        "--dedupe-distance", type=float, default=DEDUPE_METERS, metavar="METERS",
+        help="--dedupe で重複とみなす距離（既定 %(default)s m）"
+    )
+    parser.add_argument(
+        "--nearby", type=int, nargs="?", const=NEARBY_K, default=None, metavar="K",
+        help="ポップアップに、ほかのレイヤーの近い点を K 個（既定 %(const)s）距離つきで出す。"
+             "クリックでその点へ移動（scipy があれば KD 木、無ければ格子で探す。--tiles のレイヤーは対象外）"
+    )
+    parser.add_argument(
+        "--nearby-meters", type=float, default=NEARBY_METERS, metavar="METERS",
+        help="--nearby で探す距離の上限（既定 %(default)s m）"
+    )
+    parser.add_argument(
+        "--density", type=int, nargs="?", const=DENSITY_ZOOM, default=None, metavar="ZOOM",
+        help="ズーム ZOOM（既定 %(const)s）以下では点の代わりに、出ているレイヤーの件数を六角形の格子で描く"
+             "（ビルド時に集計、--tiles のレイヤーも含む）"
+    )
+    parser.add_argument(
+        "--csv-engine", choices=["c", "pyarrow"], default="c",
+        help="CSV のパーサー（pyarrow は pyarrow が入っているときだけ、無ければ c）"
+    )
+    parser.add_argument(
+        "--tiles", action="store_true",
+        help="static 以外のレイヤーを <output>-tiles/<layer>/z/x/y.json に書き出し、表示範囲のタイルだけ読み込む"
+             "（CSV は分割して読むので巨大でもよい。--lazy と同じく http(s) で配信すること）"
+    )
+    parser.add_argument(
+        "--tile-zooms", type=lambda v: tuple(int(z) for z in v.split("-")), default=TILE_ZOOMS,
+        metavar="MIN-MAX", help="--tiles で作るズーム範囲（既定 %(default)s）"
+    )
+    parser.add_argument(
+        "--canvas", action="store_true",
+        help="四角いマーカーと島の dot を共有 canvas に描く（点が多いときのパン・ズームが軽くなる）"
+    )
+    parser.add_argument(
+        "--no-minify", dest="minify", action="store_false",
+        help="HTML を minify しない（デバッグ用）"
+    )
+    parser.add_argument(
+        "--assets", choices=["cdn", "inline", "files"], default="cdn",
+        help="cdn：folium の既定（CDN から読む）。inline / files：Leaflet だけを vendor/ のコピーから"
+             "HTML に埋め込む / <output>-assets/ にハッシュ入りの名前で書く（jQuery・Bootstrap などは外す。"
+             "背景地図のタイル以外はネット不要）"
+    )
+    parser.add_argument(
+        "--fetch-vendor", action="store_true",
+        help="folium の Leaflet の版が vendor/ のコピーと違うとき、その版（JS・CSS・画像）を vendor/ に取ってきて終わる"
+             "（--assets のビルド自体はネット不要）"
+    )
+    parser.add_argument(
+        "--precompress", action="store_true",
+        help="静的ホスティング用に .gz（brotli があれば .br も）を隣に書く"
+    )
+    parser.add_argument(
+        "--profile", nargs="?", const="seto-map-profile.json", metavar="PATH",
+        help="ステージごとの時間・行数・オブジェクト数・tracemalloc ピークを JSON に書く（既定 %(const)s）"
+    )
+    parser.add_argument(
+        "--cprofile", action="store_true",
+        help="--profile と一緒に、一番遅いステージの cProfile（<PATH>.prof）も書く"
+    )
+    parser.add_argument(
+        "--variants", nargs="?", const="", metavar="JSON",
+        help="バリアント（DEFAULT_CONFIG を上書きする dict）のリストをまとめて並列にビルドする"
+             "（JSON を省略すると VARIANTS）"
+    )
+    parser.add_argument("--jobs", type=int, default=0, help="--variants のプロセス数（既定はバリアント数と CPU 数の小さい方）")
+    parser.add_argument(
+        "--serve", nargs="?", type=int, const=8000, metavar="PORT",
+        help="ファイルを書かずに http://127.0.0.1:PORT/ で配信する（既定 %(const)s）。"
+             "?layers=&show=&bbox=&center=&zoom=&name_zoom=&variant= で地図を選ぶ"
+    )
+    parser.add_argument("--cache-size", type=int, default=SERVE_CACHE_SIZE,
+                        help="--serve の LRU の大きさ（payload・ページそれぞれの件数、既定 %(default)s）")
+    parser.add_argument(
+        "--watch", action="store_true",
+        help="CSV が変わるたびに差分ビルドし直す（Ctrl-C で終了）"
+    )
+    parser.add_argument("--interval", type=float, default=1.0, help="--watch の確認間隔（秒）")
+    args = parser.parse_args(argv)
+    if args.serve and (args.lazy or args.tiles or args.assets == "files"):
+        parser.error("--serve はファイルを書かないので --lazy / --tiles / --assets files とは一緒に使えません")
+    if args.csv_engine == "pyarrow" and not HAS_PYARROW:
+        print("pyarrow が無いので --csv-engine c で読みます")
+        args.csv_engine = "c"
+    if args.precompress and brotli is None:
+        print("brotli が無いので --precompress は .gz だけ書きます（.br は pip install brotli）")
+    return args
+
+def main() -> None:
+    print("RUNNING:", __file__)
+    args = parse_args()
+
+    if args.fetch_vendor:
+        fetch_vendor()
+    elif args.serve:
+        serve(args)
+    elif args.watch:
+        try:
+            watch(args)
+        except KeyboardInterrupt:
+            pass
+    else:
+        run(args)
+
+if __name__ == "__main__":
+    main()